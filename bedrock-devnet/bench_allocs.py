@@ -0,0 +1,149 @@
+"""
+Benchmarks anvil_dumpState ingestion on synthetic dumps.
+
+Each case runs in a fresh process so that the reported peak RSS belongs to that
+case alone. Run from this directory, or with PYTHONPATH set to it:
+
+    python3 bench_allocs.py --slots 10000,100000,1000000
+"""
+import argparse
+import binascii
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from devnet.allocs import pad_hex, write_anvil_allocs
+
+parser = argparse.ArgumentParser(description='Benchmark anvil_dumpState ingestion')
+parser.add_argument('--slots', help='Comma-separated total storage slot counts', default='10000,100000,1000000')
+parser.add_argument('--slots-per-account', help='Storage slots per synthetic account', type=int, default=1000)
+parser.add_argument('--modes', help='Comma-separated ingestion modes', default='legacy,stream')
+
+
+def write_synthetic_response(path, slots, slots_per_account):
+    # Writes a JSON-RPC response wrapping a gzipped, hex-encoded anvil dump, without
+    # ever holding the whole dump in memory.
+    with open(path, 'wb') as f:
+        f.write(b'{"jsonrpc":"2.0","id":3,"result":"0x')
+        hex_out = _HexWriter(f)
+        with gzip.GzipFile(fileobj=hex_out, mode='wb', mtime=0) as gz:
+            gz.write(b'{"block":{"number":"0x1"},"accounts":{')
+            accounts = max(1, -(-slots // slots_per_account))
+            for i in range(accounts):
+                n = min(slots_per_account, slots - i * slots_per_account)
+                storage = {hex(i * slots_per_account + j): hex(j + 1) for j in range(max(n, 0))}
+                account = {'nonce': 1, 'balance': hex(10 ** 18 + i), 'code': '0x6080', 'storage': storage}
+                gz.write(('' if i == 0 else ',').encode())
+                gz.write(json.dumps('0x%040x' % (i + 1)).encode() + b':' + json.dumps(account).encode())
+            gz.write(b'}}')
+        f.write(b'"}')
+
+
+class _HexWriter(io.RawIOBase):
+    def __init__(self, f):
+        self._f = f
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._f.write(binascii.hexlify(b))
+        return len(b)
+
+
+def ingest_legacy(response_path, out_path):
+    # Mirrors the pre-streaming anvil_dumpState + convert_anvil_dump + write_json path.
+    with open(response_path, 'rb') as f:
+        data = f.read()
+    result = json.loads(data.decode('utf-8'))['result']
+    result_bytes = bytes.fromhex(result[2:])
+    uncompressed = gzip.decompress(result_bytes).decode()
+    allocs = json.loads(uncompressed)
+    for account in allocs['accounts'].values():
+        _convert_account_in_place(account)
+    with open(out_path, 'w+') as f:
+        json.dump(allocs, f, indent='  ')
+
+
+def _convert_account_in_place(account):
+    # The original convert_anvil_account, kept as the reference for the other modes.
+    bal = account['balance']
+    account['balance'] = str(int(bal, 16))
+    if 'storage' in account:
+        storage = account['storage']
+        for key in list(storage.keys()):
+            value = storage[key]
+            del storage[key]
+            storage[pad_hex(key)] = pad_hex(value)
+
+
+def ingest_stream(response_path, out_path):
+    with open(response_path, 'rb') as f:
+        write_anvil_allocs(f, out_path)
+
+
+MODES = {
+    'legacy': ingest_legacy,
+    'stream': ingest_stream,
+}
+
+
+def _run_case(mode, response_path, out_path, results):
+    start = time.perf_counter()
+    MODES[mode](response_path, out_path)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux.
+    results.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def run_case(mode, response_path, out_path):
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    proc = ctx.Process(target=_run_case, args=(mode, response_path, out_path, results))
+    proc.start()
+    elapsed, peak_mib = results.get()
+    proc.join()
+    if proc.exitcode != 0:
+        raise RuntimeError(f'{mode} benchmark exited with {proc.exitcode}')
+    return elapsed, peak_mib
+
+
+def main():
+    args = parser.parse_args()
+    modes = args.modes.split(',')
+
+    print(f'{"slots":>10} {"mode":>9} {"seconds":>10} {"peak MiB":>10} {"output MiB":>11}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for slots in (int(s) for s in args.slots.split(',')):
+            response_path = os.path.join(tmp, 'response.json')
+            write_synthetic_response(response_path, slots, args.slots_per_account)
+            outputs = []
+            for mode in modes:
+                out_path = os.path.join(tmp, f'allocs-{mode}.json')
+                elapsed, peak_mib = run_case(mode, response_path, out_path)
+                size_mib = os.path.getsize(out_path) / (1 << 20)
+                print(f'{slots:>10} {mode:>9} {elapsed:>10.3f} {peak_mib:>10.1f} {size_mib:>11.1f}')
+                outputs.append(out_path)
+            if not all(_same_file(outputs[0], o) for o in outputs[1:]):
+                raise RuntimeError(f'Outputs differ for {slots} slots')
+            for o in outputs:
+                os.remove(o)
+
+
+def _same_file(a, b, chunk_size=1 << 20):
+    with open(a, 'rb') as fa, open(b, 'rb') as fb:
+        while True:
+            ca, cb = fa.read(chunk_size), fb.read(chunk_size)
+            if ca != cb:
+                return False
+            if not ca:
+                return True
+
+
+if __name__ == '__main__':
+    main()
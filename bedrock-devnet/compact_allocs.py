@@ -0,0 +1,52 @@
+"""
+Converts allocs files to and from the compact, indexed format, and looks up single
+accounts without loading the whole file. Run from this directory, or with
+PYTHONPATH set to it:
+
+    python3 compact_allocs.py compact ../.devnet/allocs-l1.json allocs-l1.compact
+    python3 compact_allocs.py get allocs-l1.compact 0x4200000000000000000000000000000000000016
+    python3 compact_allocs.py expand allocs-l1.compact allocs-l1.json
+"""
+import argparse
+import json
+import sys
+
+from devnet.compact import CompactAllocs, write_canonical_allocs, write_compact_allocs
+
+parser = argparse.ArgumentParser(description='Compact allocs tool')
+commands = parser.add_subparsers(dest='command', required=True)
+
+compact = commands.add_parser('compact', help='Convert canonical allocs JSON into the compact format')
+compact.add_argument('src')
+compact.add_argument('dest')
+
+expand = commands.add_parser('expand', help='Convert a compact allocs file back into canonical allocs JSON')
+expand.add_argument('src')
+expand.add_argument('dest')
+
+get = commands.add_parser('get', help='Print the accounts at the given addresses')
+get.add_argument('src')
+get.add_argument('addresses', nargs='*', help='Addresses to print, or all addresses if none are given')
+
+
+def main():
+    args = parser.parse_args()
+    if args.command == 'compact':
+        write_compact_allocs(args.src, args.dest)
+    elif args.command == 'expand':
+        write_canonical_allocs(args.src, args.dest)
+    else:
+        with CompactAllocs(args.src) as allocs:
+            if not args.addresses:
+                for address in allocs.addresses():
+                    print(address)
+                return
+            missing = [a for a in args.addresses if a not in allocs]
+            if missing:
+                sys.exit(f'No account {", ".join(missing)} in {args.src}')
+            json.dump({a: allocs[a] for a in args.addresses}, sys.stdout, indent='  ')
+            print()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,26 +3,55 @@ import logging
 import os
 import subprocess
 import json
-import socket
 import calendar
-import datetime
 import time
 import shutil
-import http.client
-import gzip
-from multiprocessing import Process, Queue
+import tempfile
+import fcntl
+import multiprocessing
 import concurrent.futures
+import collections
 from collections import namedtuple
 
 
 import devnet.log_setup
+from devnet import compact, deposit_bench, instance, output, readiness, rpc, snapshot, trace
+from devnet.allocs import write_anvil_allocs
+from devnet.scheduler import DEFAULT_WORKERS, Phase, run_phases
+from devnet.cache import ArtifactCache, DEFAULT_MAX_ENTRIES, cache_key, command_output, default_cache_dir, hash_file, hash_sources
 
 pjoin = os.path.join
 
+def positive(type_):
+    def parse(value):
+        parsed = type_(value)
+        if parsed <= 0:
+            raise argparse.ArgumentTypeError(f'must be greater than 0, got {value}')
+        return parsed
+    parse.__name__ = type_.__name__
+    return parse
+
+
 parser = argparse.ArgumentParser(description='Bedrock devnet launcher')
 parser.add_argument('--monorepo-dir', help='Directory of the monorepo', default=os.getcwd())
 parser.add_argument('--allocs', help='Only create the allocs and exit', type=bool, action=argparse.BooleanOptionalAction)
+parser.add_argument('--build-images', help='Only build the docker images and exit', type=bool, action=argparse.BooleanOptionalAction)
 parser.add_argument('--test', help='Tests the deployment, must already be deployed', type=bool, action=argparse.BooleanOptionalAction)
+parser.add_argument('--instance', help='Run an isolated devnet with its own ports, data dir and compose project', type=int, default=int(os.getenv('DEVNET_INSTANCE') or 0))
+parser.add_argument('--workers', help='Number of devnet bring-up phases to run concurrently', type=int, default=DEFAULT_WORKERS)
+parser.add_argument('--cache', help='Reuse allocs and genesis files built from the same inputs', type=bool, action=argparse.BooleanOptionalAction, default=True)
+parser.add_argument('--cache-dir', help='Directory of the devnet artifact cache', default=os.getenv('DEVNET_CACHE_DIR') or default_cache_dir())
+parser.add_argument('--cache-size', help='Number of cached entries to keep per artifact', type=int, default=DEFAULT_MAX_ENTRIES)
+parser.add_argument('--snapshot', help='Save the post-deployment L1 state, addresses and deployments as a bundle at this path')
+parser.add_argument('--restore', help='Restore the post-deployment L1 state from a snapshot bundle instead of deploying with forge')
+parser.add_argument('--load-anvil', help='With --restore, load the snapshot state into the anvil node at this host:port and exit')
+parser.add_argument('--bench', help='Benchmark deposits on the deployed devnet, must already be deployed', type=bool, action=argparse.BooleanOptionalAction)
+parser.add_argument('--bench-signers', help='Number of concurrent deposit signers', type=positive(int), default=4)
+parser.add_argument('--bench-rate', help='Deposits per second to submit', type=positive(float), default=2.0)
+parser.add_argument('--bench-count', help='Total number of deposits to submit', type=positive(int), default=100)
+parser.add_argument('--bench-out', help='Path of the JSON benchmark results, defaults to .devnet/deposit-bench.json')
+parser.add_argument('--compact-allocs', help='Also write the L1 allocs in the compact, indexed format', type=bool, action=argparse.BooleanOptionalAction)
+parser.add_argument('--trace-file', help='Write a Chrome trace-event JSON profile of the run to this path', default=os.getenv('DEVNET_TRACE_FILE'))
 
 log = logging.getLogger()
 
@@ -31,37 +60,77 @@ class Bunch:
         self.__dict__.update(kwds)
 
 class ChildProcess:
-    def __init__(self, func, *args):
-        self.errq = Queue()
-        self.process = Process(target=self._func, args=(func, args))
+    """
+    Runs func(*args) in a child process. The child is spawned, not forked, since it is
+    started from a phase thread while other threads may hold locks, e.g. in logging.
+    """
 
-    def _func(self, func, args):
-        try:
-            func(*args)
-        except Exception as e:
-            self.errq.put(str(e))
+    def __init__(self, func, *args):
+        ctx = multiprocessing.get_context('spawn')
+        self.conn, self._child_conn = ctx.Pipe(duplex=False)
+        self.process = ctx.Process(target=_run_child, args=(func, args, self._child_conn))
+        self.error = None
 
     def start(self):
         self.process.start()
+        # Only the child writes, so the read end sees EOF if the child dies before it does.
+        self._child_conn.close()
 
     def join(self):
+        # Received before joining: the child blocks on exit until its result is read.
+        try:
+            self.error, spans = self.conn.recv()
+        except EOFError:
+            spans = []
+        self.conn.close()
         self.process.join()
+        if self.error is None and self.process.exitcode != 0:
+            self.error = f'exited with code {self.process.exitcode}'
+        trace.tracer.add(spans)
 
     def get_error(self):
-        return self.errq.get() if not self.errq.empty() else None
+        return self.error
+
+
+def _run_child(func, args, conn):
+    error = None
+    try:
+        func(*args)
+    except Exception as e:
+        error = str(e)
+    finally:
+        conn.send((error, trace.tracer.spans))
+        conn.close()
 
 
 def main():
     args = parser.parse_args()
+    try:
+        launch(args)
+    finally:
+        if args.trace_file:
+            trace.tracer.export_chrome(args.trace_file)
+            log.info(f'Wrote trace to {args.trace_file}')
+            trace.tracer.log_summary()
+
 
+def launch(args):
+    try:
+        ports = instance.ports(args.instance)
+    except ValueError as e:
+        parser.error(str(e))
     monorepo_dir = os.path.abspath(args.monorepo_dir)
-    devnet_dir = pjoin(monorepo_dir, '.devnet')
+    devnet_dir = pjoin(monorepo_dir, instance.devnet_dir_name(args.instance))
     contracts_bedrock_dir = pjoin(monorepo_dir, 'packages', 'contracts-bedrock')
-    deployment_dir = pjoin(contracts_bedrock_dir, 'deployments', 'devnetL1')
+    forge_deployment_dir = pjoin(contracts_bedrock_dir, 'deployments', 'devnetL1')
     op_node_dir = pjoin(args.monorepo_dir, 'op-node')
     ops_bedrock_dir = pjoin(monorepo_dir, 'ops-bedrock')
     deploy_config_dir = pjoin(contracts_bedrock_dir, 'deploy-config')
-    devnet_config_path = pjoin(deploy_config_dir, 'devnetL1.json')
+    forge_config_path = pjoin(deploy_config_dir, 'devnetL1.json')
+    # forge always deploys with the shared devnetL1 config and deployment dir, so other
+    # instances keep copies of them in their own devnet dir.
+    deployment_dir = forge_deployment_dir if args.instance == 0 else pjoin(devnet_dir, 'deployments')
+    devnet_config_path = forge_config_path if args.instance == 0 else pjoin(devnet_dir, 'devnetL1.json')
     devnet_config_template_path = pjoin(deploy_config_dir, 'devnetL1-template.json')
     ops_chain_ops = pjoin(monorepo_dir, 'op-chain-ops')
     sdk_dir = pjoin(monorepo_dir, 'packages', 'sdk')
@@ -71,9 +140,12 @@ def main():
       devnet_dir=devnet_dir,
       contracts_bedrock_dir=contracts_bedrock_dir,
       deployment_dir=deployment_dir,
-      l1_deployments_path=pjoin(deployment_dir, '.deploy'),
+      forge_deployment_dir=forge_deployment_dir,
+      l1_deployments_path=pjoin(forge_deployment_dir, '.deploy'),
       deploy_config_dir=deploy_config_dir,
       devnet_config_path=devnet_config_path,
+      forge_config_path=forge_config_path,
+      forge_lock_path=pjoin(monorepo_dir, '.devnet', 'forge.lock'),
       devnet_config_template_path=devnet_config_template_path,
       op_node_dir=op_node_dir,
       ops_bedrock_dir=ops_bedrock_dir,
@@ -82,9 +154,20 @@ def main():
       genesis_l1_path=pjoin(devnet_dir, 'genesis-l1.json'),
       genesis_l2_path=pjoin(devnet_dir, 'genesis-l2.json'),
       allocs_path=pjoin(devnet_dir, 'allocs-l1.json'),
+      compact_allocs_path=pjoin(devnet_dir, 'allocs-l1.compact') if args.compact_allocs else None,
       addresses_json_path=pjoin(devnet_dir, 'addresses.json'),
       sdk_addresses_json_path=pjoin(devnet_dir, 'sdk-addresses.json'),
-      rollup_config_path=pjoin(devnet_dir, 'rollup.json')
+      rollup_config_path=pjoin(devnet_dir, 'rollup.json'),
+      anvil_state_path=pjoin(devnet_dir, 'anvil-state.gz'),
+      cache_keys_path=pjoin(devnet_dir, 'cache-keys.json'),
+      snapshot_path=args.snapshot,
+      cache=ArtifactCache(args.cache_dir, args.cache_size) if args.cache else None,
+      instance=args.instance,
+      ports=ports,
+      compose_project=instance.compose_project(args.instance),
+      l1_rpc=f'127.0.0.1:{ports["L1_RPC_PORT"]}',
+      l2_rpc=f'127.0.0.1:{ports["L2_RPC_PORT"]}',
+      op_node_rpc=f'127.0.0.1:{ports["OP_NODE_RPC_PORT"]}'
     )
 
     if args.test:
@@ -92,58 +175,58 @@ def main():
       devnet_test(paths)
       return
 
+    if args.bench:
+        log.info('Benchmarking deposits on deployed devnet')
+        devnet_deposit_bench(paths, args.bench_signers, args.bench_rate, args.bench_count,
+                             args.bench_out or pjoin(devnet_dir, 'deposit-bench.json'))
+        return
+
+    if args.restore and args.load_anvil:
+        anvil_load_snapshot(args.load_anvil, args.restore)
+        return
+
     os.makedirs(devnet_dir, exist_ok=True)
 
+    if args.restore:
+        devnet_restore_snapshot(paths, args.restore)
+
     if args.allocs:
-        devnet_l1_genesis(paths)
+        devnet_l1_allocs(paths)
         return
 
-    git_commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
-    git_date = subprocess.run(['git', 'show', '-s', "--format=%ct"], capture_output=True, text=True).stdout.strip()
+    if args.build_images:
+        devnet_build_images(paths)
+        return
 
     # CI loads the images from workspace, and does not otherwise know the images are good as-is
-    if os.getenv('DEVNET_NO_BUILD') == "true":
-        log.info('Skipping docker images build')
-    else:
-        log.info(f'Building docker images for git commit {git_commit} ({git_date})')
-        run_command(['docker', 'compose', 'build', '--progress', 'plain',
-                     '--build-arg', f'GIT_COMMIT={git_commit}', '--build-arg', f'GIT_DATE={git_date}'],
-                    cwd=paths.ops_bedrock_dir, env={
-            'PWD': paths.ops_bedrock_dir,
-            'DOCKER_BUILDKIT': '1', # (should be available by default in later versions, but explicitly enable it anyway)
-            'COMPOSE_DOCKER_CLI_BUILD': '1'  # use the docker cache
-        })
+    build_images = os.getenv('DEVNET_NO_BUILD') != "true"
 
-    log.info('Devnet starting')
-    devnet_deploy(paths)
+    log.info(f'Devnet instance {args.instance} starting' if args.instance else 'Devnet starting')
+    devnet_deploy(paths, build_images=build_images, max_workers=args.workers)
 
 
 def deploy_contracts(paths):
-    wait_up(8545)
-    wait_for_rpc_server('127.0.0.1:8545')
-    res = eth_accounts('127.0.0.1:8545')
-
-    response = json.loads(res)
-    account = response['result'][0]
+    readiness.wait_ready(readiness.rpc(paths.l1_rpc))
+    account = eth_accounts(paths.l1_rpc)[0]
     log.info(f'Deploying with {account}')
 
     # send some ether to the create2 deployer account
     run_command([
         'cast', 'send', '--from', account,
-        '--rpc-url', 'http://127.0.0.1:8545',
+        '--rpc-url', f'http://{paths.l1_rpc}',
         '--unlocked', '--value', '5ether', '0x3fAB184622Dc19b6109349B94811493BF2a45362'
     ], env={}, cwd=paths.contracts_bedrock_dir)
 
     # deploy the create2 deployer
     run_command([
-      'cast', 'publish', '--rpc-url', 'http://127.0.0.1:8545',
+      'cast', 'publish', '--rpc-url', f'http://{paths.l1_rpc}',
       '0xf8a58085174876e800830186a08080b853604580600e600039806000f350fe7fffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffe03601600081602082378035828234f58015156039578182fd5b8082525050506014600cf31ba02222222222222222222222222222222222222222222222222222222222222222a02222222222222222222222222222222222222222222222222222222222222222'
     ], env={}, cwd=paths.contracts_bedrock_dir)
 
     fqn = 'scripts/Deploy.s.sol:Deploy'
     run_command([
         'forge', 'script', fqn, '--sender', account,
-        '--rpc-url', 'http://127.0.0.1:8545', '--broadcast',
+        '--rpc-url', f'http://{paths.l1_rpc}', '--broadcast',
         '--unlocked', '--with-gas-price', '100000000000'
     ], env={}, cwd=paths.contracts_bedrock_dir)
 
@@ -152,91 +235,235 @@ def deploy_contracts(paths):
     log.info('Syncing contracts.')
     run_command([
         'forge', 'script', fqn, '--sig', 'sync()',
-        '--rpc-url', 'http://127.0.0.1:8545'
+        '--rpc-url', f'http://{paths.l1_rpc}'
     ], env={}, cwd=paths.contracts_bedrock_dir)
 
-def init_devnet_l1_deploy_config(paths, update_timestamp=False):
+def init_devnet_l1_deploy_config(paths, update_timestamp=False, path=None):
     deploy_config = read_json(paths.devnet_config_template_path)
     if update_timestamp:
         deploy_config['l1GenesisBlockTimestamp'] = '{:#x}'.format(int(time.time()))
-    write_json(paths.devnet_config_path, deploy_config)
+    write_json(path or paths.devnet_config_path, deploy_config)
 
 def devnet_l1_genesis(paths):
+    # Devnet instances share the forge deploy config and deployment dir, so only one
+    # of them can deploy at a time.
+    os.makedirs(os.path.dirname(paths.forge_lock_path), exist_ok=True)
+    with open(paths.forge_lock_path, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        devnet_l1_deploy(paths)
+        if paths.deployment_dir != paths.forge_deployment_dir:
+            shutil.copyfile(paths.forge_config_path, paths.devnet_config_path)
+            shutil.rmtree(paths.deployment_dir, ignore_errors=True)
+            shutil.copytree(paths.forge_deployment_dir, paths.deployment_dir)
+
+def devnet_l1_deploy(paths):
     log.info('Generating L1 genesis state')
-    init_devnet_l1_deploy_config(paths)
+    init_devnet_l1_deploy_config(paths, path=paths.forge_config_path)
 
-    geth = subprocess.Popen([
-        'anvil', '-a', '10', '--port', '8545', '--chain-id', '1337', '--disable-block-gas-limit',
-        '--gas-price', '0', '--base-fee', '1', '--block-time', '1'
-    ])
+    with trace.span('anvil', 'command'):
+        geth = subprocess.Popen([
+            'anvil', '-a', '10', '--port', str(paths.ports['L1_RPC_PORT']), '--chain-id', '1337', '--disable-block-gas-limit',
+            '--gas-price', '0', '--base-fee', '1', '--block-time', '1'
+        ])
 
-    try:
-        forge = ChildProcess(deploy_contracts, paths)
-        forge.start()
-        forge.join()
-        err = forge.get_error()
-        if err:
-            raise Exception(f"Exception occurred in child process: {err}")
-
-        res = anvil_dumpState('127.0.0.1:8545')
-        allocs = convert_anvil_dump(res)
-        write_json(paths.allocs_path, allocs)
-    finally:
-        geth.terminate()
+        try:
+            forge = ChildProcess(deploy_contracts, paths)
+            forge.start()
+            forge.join()
+            err = forge.get_error()
+            if err:
+                raise Exception(f"Exception occurred in child process: {err}")
+
+            with trace.span('anvil_dumpState', 'rpc'):
+                anvil_dump_allocs(paths.l1_rpc, paths.allocs_path, paths.anvil_state_path)
+        finally:
+            geth.terminate()
+
+
+def devnet_l1_allocs(paths):
+    cached_artifacts(paths, 'allocs', lambda: allocs_cache_key(paths), l1_allocs_outputs(paths),
+                     lambda: devnet_l1_genesis(paths), optional=['anvil-state.gz'])
+    if paths.snapshot_path:
+        entries = {k: v for k, v in l1_allocs_outputs(paths).items() if os.path.exists(v)}
+        snapshot.save_snapshot(paths.snapshot_path, entries, metadata={'git_commit': git_commit()})
+    if paths.compact_allocs_path and (not os.path.exists(paths.compact_allocs_path) or
+                                      os.path.getmtime(paths.compact_allocs_path) < os.path.getmtime(paths.allocs_path)):
+        log.info(f'Writing compact allocs to {paths.compact_allocs_path}')
+        compact.write_compact_allocs(paths.allocs_path, paths.compact_allocs_path)
+
+
+def l1_allocs_outputs(paths):
+    # Everything the post-deployment L1 state consists of. The raw anvil state is only
+    # available when the allocs were generated by this launcher.
+    return {
+        'allocs-l1.json': paths.allocs_path,
+        'addresses.json': paths.addresses_json_path,
+        'devnetL1.json': paths.devnet_config_path,
+        'deployments': paths.deployment_dir,
+        'anvil-state.gz': paths.anvil_state_path,
+    }
+
+
+def devnet_restore_snapshot(paths, bundle_path):
+    manifest = snapshot.read_manifest(bundle_path)
+    outputs = {k: v for k, v in l1_allocs_outputs(paths).items() if k in manifest['entries']}
+    snapshot.restore_snapshot(bundle_path, outputs)
+    # The restored allocs did not come from the current inputs, so use them as-is rather
+    # than comparing them against the allocs cache key.
+    keys = read_json(paths.cache_keys_path) if os.path.exists(paths.cache_keys_path) else {}
+    keys.pop('allocs', None)
+    write_json(paths.cache_keys_path, keys)
+
+
+def anvil_load_snapshot(url, bundle_path):
+    log.info(f'Loading snapshot {bundle_path} into anvil at {url}')
+    state = snapshot.extract_file(bundle_path, 'anvil-state.gz')
+    rpc.client(url).call('anvil_loadState', '0x' + state.hex(), timeout=300)
 
 
 # Bring up the devnet where the contracts are deployed to L1
-def devnet_deploy(paths):
-    if os.path.exists(paths.genesis_l1_path):
-        log.info('L1 genesis already generated.')
-    else:
-        log.info('Generating L1 genesis.')
-        if os.path.exists(paths.allocs_path) == False:
-            devnet_l1_genesis(paths)
+def devnet_deploy(paths, build_images=True, max_workers=DEFAULT_WORKERS):
+    # Phases start as soon as the phases producing their inputs are done, so the
+    # docker build overlaps with the anvil/forge allocs generation.
+    run_phases([
+        Phase('docker-build', lambda: devnet_build_images(paths) if build_images else log.info('Skipping docker images build'),
+              outputs=['images']),
+        Phase('allocs', lambda: devnet_l1_allocs(paths), outputs=['allocs']),
+        Phase('genesis-tool', lambda: devnet_build_genesis_tool(paths), outputs=['genesis-tool']),
+        Phase('genesis-l1', lambda: devnet_genesis_l1(paths), inputs=['allocs', 'genesis-tool'], outputs=['genesis-l1']),
+        Phase('l1', lambda: devnet_l1_up(paths), inputs=['images', 'genesis-l1'], outputs=['l1']),
+        Phase('genesis-l2', lambda: devnet_genesis_l2(paths), inputs=['l1', 'genesis-tool'], outputs=['genesis-l2']),
+        Phase('l2', lambda: devnet_l2_up(paths), inputs=['images', 'genesis-l2'], outputs=['l2']),
+        Phase('op-services', lambda: devnet_op_services_up(paths), inputs=['l1', 'l2'], outputs=['op-services']),
+        Phase('artifact-server', lambda: devnet_artifact_server_up(paths), inputs=['l1'], outputs=['artifact-server']),
+    ], max_workers=max_workers)
+
+    log.info('Devnet ready.')
 
+
+def devnet_build_images(paths):
+    commit = git_commit()
+    git_date = subprocess.run(['git', 'show', '-s', "--format=%ct"], capture_output=True, text=True).stdout.strip()
+
+    log.info(f'Building docker images for git commit {commit} ({git_date})')
+    run_command(['docker', 'compose', 'build', '--progress', 'plain',
+                 '--build-arg', f'GIT_COMMIT={commit}', '--build-arg', f'GIT_DATE={git_date}'],
+                cwd=paths.ops_bedrock_dir, env=compose_env(paths, {
+        'DOCKER_BUILDKIT': '1', # (should be available by default in later versions, but explicitly enable it anyway)
+        'COMPOSE_DOCKER_CLI_BUILD': '1'  # use the docker cache
+    }))
+
+
+def devnet_genesis_l1(paths):
+    def l1_genesis_key():
+        return cache_key('genesis-l1', hash_file(paths.allocs_path), hash_file(paths.addresses_json_path),
+                         hash_file(paths.devnet_config_template_path), op_node_cache_key(paths))
+
+    def build_l1_genesis():
+        log.info('Generating L1 genesis.')
         # It's odd that we want to regenerate the devnetL1.json file with
         # an updated timestamp different than the one used in the devnet_l1_genesis
         # function.  But, without it, CI flakes on this test rather consistently.
         # If someone reads this comment and understands why this is being done, please
         # update this comment to explain.
         init_devnet_l1_deploy_config(paths, update_timestamp=True)
-        run_command([
-            'go', 'run', 'cmd/main.go', 'genesis', 'l1',
+        run_genesis_tool(paths, [
+            'l1',
             '--deploy-config', paths.devnet_config_path,
             '--l1-allocs', paths.allocs_path,
             '--l1-deployments', paths.addresses_json_path,
             '--outfile.l1', paths.genesis_l1_path,
-        ], cwd=paths.op_node_dir)
+        ])
+
+    # Not restored from the artifact cache: build_l1_genesis stamps the current time
+    # into the genesis, and a restored one could be days old. With the genesis tool
+    # prebuilt, rebuilding only takes a moment.
+    cached_artifacts(paths, 'genesis-l1', l1_genesis_key, {
+        'genesis-l1.json': paths.genesis_l1_path,
+        'devnetL1.json': paths.devnet_config_path,
+    }, build_l1_genesis, cache=False)
+
+
+def devnet_build_genesis_tool(paths):
+    # Compiling op-node dominates a cold `go run`, so build it once per source hash
+    # and run the binary for every genesis step.
+    tool = genesis_tool_path(paths)
+    if os.path.exists(tool):
+        if paths.cache is not None:
+            paths.cache.lookup('op-node-bin', op_node_cache_key(paths))
+        log.info(f'Using prebuilt op-node genesis tool {tool}')
+        return
 
+    log.info('Building op-node genesis tool.')
+    start = time.monotonic()
+    build_dir = pjoin(paths.cache.root, 'op-node-bin') if paths.cache is not None else os.path.dirname(tool)
+    os.makedirs(build_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix='.tmp-', dir=build_dir) as tmp:
+        binary = pjoin(tmp, 'op-node')
+        with trace.span('go build op-node', 'build'):
+            run_command(['go', 'build', '-o', binary, './cmd'], cwd=paths.op_node_dir)
+        if paths.cache is not None:
+            paths.cache.store('op-node-bin', op_node_cache_key(paths), {'op-node': binary}, move=True)
+        else:
+            for old in os.listdir(build_dir):
+                if old.startswith('op-node-'):
+                    os.remove(pjoin(build_dir, old))
+            os.replace(binary, tool)
+    log.info(f'Built op-node genesis tool in {time.monotonic() - start:.2f}s')
+
+
+def genesis_tool_path(paths):
+    key = op_node_cache_key(paths)
+    if paths.cache is None:
+        return pjoin(paths.devnet_dir, 'bin', f'op-node-{key[:16]}')
+    return pjoin(paths.cache.root, 'op-node-bin', key, 'op-node')
+
+
+def run_genesis_tool(paths, args):
+    start = time.monotonic()
+    run_command([genesis_tool_path(paths), 'genesis', *args], cwd=paths.op_node_dir)
+    log.info(f'op-node genesis {args[0]} ran in {time.monotonic() - start:.2f}s')
+
+
+def devnet_l1_up(paths):
     log.info('Starting L1.')
-    run_command(['docker', 'compose', 'up', '-d', 'l1'], cwd=paths.ops_bedrock_dir, env={
-        'PWD': paths.ops_bedrock_dir
-    })
-    wait_up(8545)
-    wait_for_rpc_server('127.0.0.1:8545')
-
-    if os.path.exists(paths.genesis_l2_path):
-        log.info('L2 genesis and rollup configs already generated.')
-    else:
+    run_command(['docker', 'compose', 'up', '-d', 'l1'], cwd=paths.ops_bedrock_dir, env=compose_env(paths))
+    readiness.wait_ready(readiness.rpc(paths.l1_rpc))
+
+
+def devnet_genesis_l2(paths):
+    def l2_genesis_key():
+        # The L1 starting block is read from the L1 chain, which is fully determined by the L1 genesis.
+        return cache_key('genesis-l2', hash_file(paths.genesis_l1_path), hash_file(paths.devnet_config_path),
+                         hash_file(paths.addresses_json_path), op_node_cache_key(paths))
+
+    def build_l2_genesis():
         log.info('Generating L2 genesis and rollup configs.')
-        run_command([
-            'go', 'run', 'cmd/main.go', 'genesis', 'l2',
-            '--l1-rpc', 'http://localhost:8545',
+        run_genesis_tool(paths, [
+            'l2',
+            '--l1-rpc', f'http://{paths.l1_rpc}',
             '--deploy-config', paths.devnet_config_path,
             '--deployment-dir', paths.deployment_dir,
             '--outfile.l2', paths.genesis_l2_path,
             '--outfile.rollup', paths.rollup_config_path
-        ], cwd=paths.op_node_dir)
+        ])
+
+    # Keyed on the L1 genesis, so it is not restored from the artifact cache either.
+    cached_artifacts(paths, 'genesis-l2', l2_genesis_key, {
+        'genesis-l2.json': paths.genesis_l2_path,
+        'rollup.json': paths.rollup_config_path,
+    }, build_l2_genesis, cache=False)
 
-    rollup_config = read_json(paths.rollup_config_path)
-    addresses = read_json(paths.addresses_json_path)
 
+def devnet_l2_up(paths):
     log.info('Bringing up L2.')
-    run_command(['docker', 'compose', 'up', '-d', 'l2'], cwd=paths.ops_bedrock_dir, env={
-        'PWD': paths.ops_bedrock_dir
-    })
-    wait_up(9545)
-    wait_for_rpc_server('127.0.0.1:9545')
+    run_command(['docker', 'compose', 'up', '-d', 'l2'], cwd=paths.ops_bedrock_dir, env=compose_env(paths))
+    readiness.wait_ready(readiness.rpc(paths.l2_rpc))
+
+
+def devnet_op_services_up(paths):
+    rollup_config = read_json(paths.rollup_config_path)
+    addresses = read_json(paths.addresses_json_path)
 
     l2_output_oracle = addresses['L2OutputOracleProxy']
     log.info(f'Using L2OutputOracle {l2_output_oracle}')
@@ -244,105 +471,131 @@ def devnet_deploy(paths):
     log.info(f'Using batch inbox {batch_inbox_address}')
 
     log.info('Bringing up `op-node`, `op-proposer` and `op-batcher`.')
-    run_command(['docker', 'compose', 'up', '-d', 'op-node', 'op-proposer', 'op-batcher'], cwd=paths.ops_bedrock_dir, env={
-        'PWD': paths.ops_bedrock_dir,
+    run_command(['docker', 'compose', 'up', '-d', 'op-node', 'op-proposer', 'op-batcher'], cwd=paths.ops_bedrock_dir, env=compose_env(paths, {
         'L2OO_ADDRESS': l2_output_oracle,
         'SEQUENCER_BATCH_INBOX_ADDRESS': batch_inbox_address
-    })
+    }))
+    readiness.wait_ready(readiness.op_node_synced(paths.op_node_rpc), readiness.block_advancing(paths.l2_rpc))
+
 
+def devnet_artifact_server_up(paths):
     log.info('Bringing up `artifact-server`')
-    run_command(['docker', 'compose', 'up', '-d', 'artifact-server'], cwd=paths.ops_bedrock_dir, env={
-        'PWD': paths.ops_bedrock_dir
-    })
+    run_command(['docker', 'compose', 'up', '-d', 'artifact-server'], cwd=paths.ops_bedrock_dir, env=compose_env(paths))
 
-    log.info('Devnet ready.')
+
+def compose_env(paths, env=None):
+    # The ports and config dir of this devnet instance, see ops-bedrock/docker-compose.yml.
+    return {
+        'PWD': paths.ops_bedrock_dir,
+        'DEVNET_DIR': paths.devnet_dir,
+        **({'COMPOSE_PROJECT_NAME': paths.compose_project} if paths.compose_project else {}),
+        **{name: str(port) for name, port in paths.ports.items()},
+        **(env or {})
+    }
+
+
+def cached_artifacts(paths, kind, key_fn, outputs, build, optional=(), cache=True):
+    """
+    Brings `outputs` ({cache entry name: path}) up to date with the inputs hashed by key_fn,
+    either by restoring them from the artifact cache or by running build() and caching the
+    result. Outputs of unknown provenance, such as allocs copied in by CI or restored from a
+    snapshot, are kept as-is. Outputs named in `optional` may be missing.
+
+    Without `cache`, outputs are only rebuilt when their inputs change, never restored.
+    """
+    cache = paths.cache if cache else None
+    required = [p for name, p in outputs.items() if name not in optional]
+    keys = read_json(paths.cache_keys_path) if os.path.exists(paths.cache_keys_path) else {}
+    if kind not in keys and all(os.path.exists(p) for p in required):
+        log.info(f'{kind} already generated.')
+        return
+
+    key = key_fn()
+    if keys.get(kind) == key and all(os.path.exists(p) for p in required):
+        log.info(f'{kind} already generated.')
+        return
+
+    if cache is not None and cache.restore(kind, key, outputs, optional):
+        log.info(f'Restored {kind} from cache entry {key[:12]}.')
+    else:
+        build()
+        if cache is not None:
+            cache.store(kind, key, outputs, optional)
+
+    keys[kind] = key
+    write_json(paths.cache_keys_path, keys)
+
+
+def allocs_cache_key(paths):
+    return cache_key(
+        'allocs',
+        hash_sources(paths.mono_repo_dir, [
+            'bedrock-devnet/devnet/__init__.py',
+            'packages/contracts-bedrock/src',
+            'packages/contracts-bedrock/scripts',
+            'packages/contracts-bedrock/foundry.toml',
+            'packages/contracts-bedrock/deploy-config/devnetL1-template.json',
+        ]),
+        command_output(['git', 'submodule', 'status', 'packages/contracts-bedrock/lib'], cwd=paths.mono_repo_dir),
+        command_output(['forge', '--version']),
+        command_output(['anvil', '--version']),
+        command_output(['cast', '--version']),
+    )
+
+
+def op_node_cache_key(paths):
+    # op-node genesis is built from the root Go module, so hash the packages it pulls in.
+    return cache_key(
+        'op-node',
+        hash_sources(paths.mono_repo_dir, ['go.mod', 'go.sum', 'op-node', 'op-chain-ops', 'op-bindings', 'op-service']),
+        command_output(['go', 'version']),
+    )
 
 
 def eth_accounts(url):
     log.info(f'Fetch eth_accounts {url}')
-    conn = http.client.HTTPConnection(url)
-    headers = {'Content-type': 'application/json'}
-    body = '{"id":2, "jsonrpc":"2.0", "method": "eth_accounts", "params":[]}'
-    conn.request('POST', '/', body, headers)
-    response = conn.getresponse()
-    data = response.read().decode()
-    conn.close()
-    return data
-
-
-def anvil_dumpState(url):
-    log.info(f'Fetch debug_dumpBlock {url}')
-    conn = http.client.HTTPConnection(url)
-    headers = {'Content-type': 'application/json'}
-    body = '{"id":3, "jsonrpc":"2.0", "method": "anvil_dumpState", "params":[]}'
-    conn.request('POST', '/', body, headers)
-    data = conn.getresponse().read()
-    # Anvil returns a JSON-RPC response with a hex-encoded "result" field
-    result = json.loads(data.decode('utf-8'))['result']
-    result_bytes = bytes.fromhex(result[2:])
-    uncompressed = gzip.decompress(result_bytes).decode()
-    return json.loads(uncompressed)
-
-def convert_anvil_dump(dump):
-    accounts = dump['accounts']
-
-    for account in accounts.values():
-        bal = account['balance']
-        account['balance'] = str(int(bal, 16))
-
-        if 'storage' in account:
-            storage = account['storage']
-            storage_keys = list(storage.keys())
-            for key in storage_keys:
-                value = storage[key]
-                del storage[key]
-                storage[pad_hex(key)] = pad_hex(value)
-
-    return dump
-
-def pad_hex(input):
-    return '0x' + input.replace('0x', '').zfill(64)
-
-def wait_for_rpc_server(url):
-    log.info(f'Waiting for RPC server at {url}')
-
-    headers = {'Content-type': 'application/json'}
-    body = '{"id":1, "jsonrpc":"2.0", "method": "eth_chainId", "params":[]}'
-
-    while True:
-        try:
-            conn = http.client.HTTPConnection(url)
-            conn.request('POST', '/', body, headers)
-            response = conn.getresponse()
-            if response.status < 300:
-                log.info(f'RPC server at {url} ready')
-                return
-        except Exception as e:
-            log.info(f'Waiting for RPC server at {url}')
-            time.sleep(1)
-        finally:
-            if conn:
-                conn.close()
+    return rpc.client(url).call('eth_accounts')
+
 
+def anvil_dump_allocs(url, path, state_path=None):
+    log.info(f'Streaming anvil_dumpState {url} to {path}')
+    # The dump is too large to buffer, so parse the raw response body as it arrives.
+    with rpc.client(url).stream('anvil_dumpState', timeout=300) as response:
+        write_anvil_allocs(response, path, state_path)
 
-CommandPreset = namedtuple('Command', ['name', 'args', 'cwd', 'timeout'])
+
+CommandPreset = namedtuple('Command', ['name', 'args', 'cwd', 'timeout', 'env'], defaults=[None])
+
+# Lines of stderr kept for the error message of a failed test command.
+ERROR_TAIL_LINES = 200
 
 
 def devnet_test(paths):
+    # The devnetL1 hardhat network reads the L1 URL of this instance from DEVNET_L1_RPC.
+    env = {'DEVNET_L1_RPC': f'http://{paths.l1_rpc}'}
+    l2_url = f'http://{paths.l2_rpc}'
     # Run the two commands with different signers, so the ethereum nonce management does not conflict
     # And do not use devnet system addresses, to avoid breaking fee-estimation or nonce values.
     run_commands([
         CommandPreset('erc20-test',
           ['npx', 'hardhat',  'deposit-erc20', '--network',  'devnetL1',
-           '--l1-contracts-json-path', paths.addresses_json_path, '--signer-index', '14'],
-          cwd=paths.sdk_dir, timeout=8*60),
+           '--l1-contracts-json-path', paths.addresses_json_path, '--signer-index', '14',
+           '--l2-provider-url', l2_url, '--op-node-provider-url', f'http://{paths.op_node_rpc}'],
+          cwd=paths.sdk_dir, timeout=8*60, env=env),
         CommandPreset('eth-test',
           ['npx', 'hardhat',  'deposit-eth', '--network',  'devnetL1',
-           '--l1-contracts-json-path', paths.addresses_json_path, '--signer-index', '15'],
-          cwd=paths.sdk_dir, timeout=8*60)
+           '--l1-contracts-json-path', paths.addresses_json_path, '--signer-index', '15',
+           '--l2-provider-url', l2_url],
+          cwd=paths.sdk_dir, timeout=8*60, env=env)
     ], max_workers=2)
 
 
+def devnet_deposit_bench(paths, signers, rate, count, out_path):
+    portal = read_json(paths.addresses_json_path)['OptimismPortalProxy']
+    results = deposit_bench.run_deposit_bench(paths.l1_rpc, paths.l2_rpc, portal, signers, rate, count)
+    deposit_bench.write_results(out_path, results)
+
+
 def run_commands(commands: list[CommandPreset], max_workers=2):
     with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
         futures = [executor.submit(run_command_preset, cmd) for cmd in commands]
@@ -354,61 +607,71 @@ def run_commands(commands: list[CommandPreset], max_workers=2):
 
 
 def run_command_preset(command: CommandPreset):
-    with subprocess.Popen(command.args, cwd=command.cwd,
-                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) as proc:
-        try:
-            # Live output processing
-            for line in proc.stdout:
-                # Annotate and print the line with timestamp and command name
-                timestamp = datetime.datetime.utcnow().strftime('%H:%M:%S.%f')
-                # Annotate and print the line with the timestamp
-                print(f"[{timestamp}][{command.name}] {line}", end='')
-
-            stdout, stderr = proc.communicate(timeout=command.timeout)
-
-            if proc.returncode != 0:
-                raise RuntimeError(f"Command '{' '.join(command.args)}' failed with return code {proc.returncode}: {stderr}")
-
-        except subprocess.TimeoutExpired:
-            raise RuntimeError(f"Command '{' '.join(command.args)}' timed out!")
-
-        except Exception as e:
-            raise RuntimeError(f"Error executing '{' '.join(command.args)}': {e}")
-
-        finally:
-            # Ensure process is terminated
-            proc.kill()
+    with trace.span(command.name, 'test', argv=command.args):
+        # The timeout counts from process start, not from when stdout closes.
+        deadline = time.monotonic() + command.timeout if command.timeout else None
+        env = {**os.environ, **command.env} if command.env else None
+        with subprocess.Popen(command.args, cwd=command.cwd, env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc:
+            stderr_tail = collections.deque(maxlen=ERROR_TAIL_LINES)
+            timestamps = output.Timestamps()
+            try:
+                # Live output processing, draining stdout and stderr together
+                for stream, line in output.iter_lines(proc, deadline):
+                    if stream is proc.stderr:
+                        stderr_tail.append(line)
+                        continue
+                    # Annotate and print the line with timestamp and command name
+                    print(f"[{timestamps.now()}][{command.name}] {line}", end='')
+
+                proc.wait(timeout=max(deadline - time.monotonic(), 0) if deadline else None)
+
+                if proc.returncode != 0:
+                    raise RuntimeError(f"Command '{' '.join(command.args)}' failed with return code {proc.returncode}: {''.join(stderr_tail)}")
+
+            except (TimeoutError, subprocess.TimeoutExpired):
+                raise RuntimeError(f"Command '{' '.join(command.args)}' timed out after {command.timeout}s!")
+
+            except Exception as e:
+                raise RuntimeError(f"Error executing '{' '.join(command.args)}': {e}")
+
+            finally:
+                # Ensure process is terminated
+                proc.kill()
     return proc.returncode
 
 
 def run_command(args, check=True, shell=False, cwd=None, env=None, timeout=None):
     env = env if env else {}
-    return subprocess.run(
-        args,
-        check=check,
-        shell=shell,
-        env={
-            **os.environ,
-            **env
-        },
-        cwd=cwd,
-        timeout=timeout
-    )
-
-
-def wait_up(port, retries=10, wait_secs=1):
-    for i in range(0, retries):
-        log.info(f'Trying 127.0.0.1:{port}')
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            s.connect(('127.0.0.1', int(port)))
-            s.shutdown(2)
-            log.info(f'Connected 127.0.0.1:{port}')
-            return True
-        except Exception:
-            time.sleep(wait_secs)
-
-    raise Exception(f'Timed out waiting for port {port}.')
+    with trace.span(command_label(args), 'command', argv=args if shell else list(args), cwd=cwd):
+        return subprocess.run(
+            args,
+            check=check,
+            shell=shell,
+            env={
+                **os.environ,
+                **env
+            },
+            cwd=cwd,
+            timeout=timeout
+        )
+
+
+def command_label(args):
+    # Group spans by the command words before the first flag, e.g. `docker compose up`
+    # or `go run cmd/main.go genesis l1`, so labels stay stable across runs.
+    if isinstance(args, str):
+        args = args.split()
+    words = []
+    for arg in args:
+        if arg.startswith('-'):
+            break
+        words.append(arg)
+    return ' '.join(words)
+
+
+def git_commit():
+    return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
 
 
 def write_json(path, data):
@@ -0,0 +1,272 @@
+import binascii
+import codecs
+import contextlib
+import json
+import re
+import zlib
+
+# Size of the reads from the anvil_dumpState response body.
+CHUNK_SIZE = 1 << 16
+# Accounts are converted in batches of roughly this many storage slots.
+BATCH_SLOTS = 10000
+
+_RESULT_RE = re.compile(rb'"result"\s*:\s*"')
+_WS_RE = re.compile(r'[ \t\n\r]*')
+
+
+def convert_anvil_dump(dump):
+    dump['accounts'] = {address: convert_anvil_account(account) for address, account in dump['accounts'].items()}
+    return dump
+
+
+def convert_anvil_account(account):
+    """
+    Returns a copy of an anvil account with a decimal balance and zero-padded
+    storage keys and values, keeping the key order of the input.
+    """
+    converted = dict(account)
+    converted['balance'] = str(int(account['balance'], 16))
+
+    if 'storage' in account:
+        # pad_hex inlined: building a new dict is much cheaper than deleting and
+        # re-inserting every slot, and a function call per key and value adds up.
+        converted['storage'] = {
+            '0x' + key.replace('0x', '').zfill(64): '0x' + value.replace('0x', '').zfill(64)
+            for key, value in account['storage'].items()
+        }
+
+    return converted
+
+
+def pad_hex(input):
+    return '0x' + input.replace('0x', '').zfill(64)
+
+
+def write_anvil_allocs(stream, path, state_path=None, chunk_size=CHUNK_SIZE):
+    """
+    Streams a raw anvil_dumpState JSON-RPC response body from the binary file-like
+    `stream` into an allocs file at `path`.
+
+    The gzipped, hex-encoded dump is decoded, decompressed and parsed one account at
+    a time, so peak memory is bounded by the largest account rather than the whole
+    state. The output is byte-identical to write_json(path, convert_anvil_dump(dump)).
+
+    If `state_path` is set, the gzipped dump is also written there, in the form
+    anvil_loadState accepts once hex-encoded.
+
+    """
+    with contextlib.ExitStack() as stack:
+        state_out = stack.enter_context(open(state_path, 'wb')) if state_path else None
+        dump = JSONObjectStream(iter_anvil_dump_text(stream, chunk_size, state_out))
+        _write_allocs(dump, path)
+        # Reads the rest of the response, so the state file gets the gzip trailer and a
+        # truncated gzip stream is rejected.
+        dump.finish()
+
+
+def _write_allocs(dump, path, convert=True):
+    with open(path, 'w') as f:
+        f.write('{')
+        first = True
+        for key in dump.keys():
+            f.write(('' if first else ',') + '\n  ' + json.dumps(key) + ': ')
+            first = False
+            if key != 'accounts':
+                f.write(_dumps(dump.value(), 1))
+                continue
+            f.write('{')
+            with _AccountWriter(f, convert) as accounts:
+                for address in dump.keys():
+                    accounts.add(address, dump.value())
+            f.write('}' if accounts.count == 0 else '\n  }')
+        f.write('}' if first else '\n}')
+
+
+class _AccountWriter:
+    """Converts accounts in batches and writes them in their original order."""
+
+    def __init__(self, f, convert=True):
+        self.count = 0
+        self._f = f
+        self._convert = convert
+        self._batch = []
+        self._slots = 0
+
+    def add(self, address, account):
+        self._batch.append((address, account))
+        self._slots += len(account.get('storage', ())) + 1
+        if self._slots >= BATCH_SLOTS:
+            self._flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._flush()
+
+    def _flush(self):
+        batch, self._batch, self._slots = self._batch, [], 0
+        for entry in _convert_batch(batch, self._convert):
+            self._f.write(('' if self.count == 0 else ',') + entry)
+            self.count += 1
+
+
+def _convert_batch(batch, convert=True):
+    return [
+        '\n    ' + json.dumps(address) + ': ' + _dumps(convert_anvil_account(account) if convert else account, 2)
+        for address, account in batch
+    ]
+
+
+def iter_anvil_dump_text(stream, chunk_size=CHUNK_SIZE, raw_out=None):
+    """
+    Yields the decompressed JSON text of an anvil_dumpState response in chunks,
+    copying the compressed bytes to `raw_out` if it is set.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for compressed in _iter_hex_result(stream, chunk_size):
+        if raw_out is not None:
+            raw_out.write(compressed)
+        text = decoder.decode(decompressor.decompress(compressed))
+        if text:
+            yield text
+    text = decoder.decode(decompressor.flush(), final=True)
+    if text:
+        yield text
+    if not decompressor.eof:
+        raise ValueError('anvil_dumpState result is not a complete gzip stream')
+
+
+def _iter_hex_result(stream, chunk_size):
+    # Scan for the start of the hex-encoded "result" string. Anything else is
+    # most likely a JSON-RPC error, which is small enough to report in full.
+    buf = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            raise ValueError(f'No result in anvil_dumpState response: {buf[:1024].decode(errors="replace")}')
+        buf += chunk
+        match = _RESULT_RE.search(buf)
+        if match:
+            buf = buf[match.end():]
+            break
+        if len(buf) > chunk_size:
+            buf = buf[-64:]
+    while len(buf) < 2:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            raise ValueError('Truncated anvil_dumpState response')
+        buf += chunk
+    buf = buf.removeprefix(b'0x')
+
+    carry = b''
+    while True:
+        end = buf.find(b'"')
+        if end >= 0:
+            yield binascii.unhexlify(carry + buf[:end])
+            return
+        buf = carry + buf
+        even = len(buf) & ~1
+        yield binascii.unhexlify(buf[:even])
+        carry = buf[even:]
+        buf = stream.read(chunk_size)
+        if not buf:
+            raise ValueError('Truncated anvil_dumpState response')
+
+
+class JSONObjectStream:
+    """
+    Incrementally walks JSON objects read from an iterator of text chunks.
+
+    keys() iterates over the keys of the object at the current position. The caller
+    must consume each key's value, either with value() or with a nested keys(),
+    before advancing to the next key. Only the text of the value being decoded is
+    held in memory.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def keys(self):
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            if self._peek() != '"':
+                raise ValueError(f'Expected object key at offset {self._pos}')
+            key = self.value()
+            self._expect(':')
+            yield key
+            c = self._peek()
+            self._pos += 1
+            if c == '}':
+                return
+            if c != ',':
+                raise ValueError(f'Expected "," or "}}" but found {c!r}')
+
+    def value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # A number that ends the buffer may continue in the next chunk.
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # Grow geometrically so large values are re-parsed a bounded number of times.
+            self._grow(2 * (len(self._buf) - self._pos))
+
+    def finish(self):
+        """Consumes the rest of the chunks, which must only hold whitespace."""
+        while True:
+            if self._buf[self._pos:].strip(' \t\n\r'):
+                raise ValueError(f'Unexpected data after the JSON object: {self._buf[self._pos:self._pos + 64]!r}')
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._eof = True
+                self._buf, self._pos = '', 0
+                return
+            self._buf, self._pos = chunk, 0
+
+    def _peek(self):
+        while True:
+            self._pos = _WS_RE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if self._eof:
+                raise ValueError('Unexpected end of JSON stream')
+            self._grow(1)
+
+    def _expect(self, c):
+        found = self._peek()
+        if found != c:
+            raise ValueError(f'Expected {c!r} but found {found!r}')
+        self._pos += 1
+
+    def _grow(self, size):
+        parts = [self._buf[self._pos:]]
+        total = len(parts[0])
+        while total < size or len(parts) == 1:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._eof = True
+                break
+            parts.append(chunk)
+            total += len(chunk)
+        self._buf = ''.join(parts)
+        self._pos = 0
+
+
+def _dumps(value, depth):
+    # Matches the layout of json.dump(..., indent='  ') for a value nested `depth` levels deep.
+    return json.dumps(value, indent='  ').replace('\n', '\n' + '  ' * depth)
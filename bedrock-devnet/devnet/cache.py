@@ -0,0 +1,137 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+
+DEFAULT_MAX_ENTRIES = 4
+
+
+def default_cache_dir():
+    base = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'bedrock-devnet')
+
+
+class ArtifactCache:
+    """
+    Content-addressed store for devnet artifacts.
+
+    Entries live in <root>/<kind>/<key>/, one file or directory per named output.
+    Each kind keeps at most `max_entries` entries, evicting the least recently used.
+    """
+
+    def __init__(self, root, max_entries=DEFAULT_MAX_ENTRIES):
+        self.root = root
+        self.max_entries = max_entries
+
+    def lookup(self, kind, key):
+        """Returns the directory of an entry, marking it recently used, or None on a miss."""
+        entry = os.path.join(self.root, kind, key)
+        if not os.path.isdir(entry):
+            return None
+        os.utime(entry)
+        return entry
+
+    def restore(self, kind, key, outputs, optional=()):
+        """
+        Copies the cached `outputs` ({name: dest path}) into place. Returns False on a
+        miss, or if the entry lacks an output that is not in `optional`.
+        """
+        entry = os.path.join(self.root, kind, key)
+        if not os.path.isdir(entry):
+            return False
+        present = {name for name in outputs if os.path.exists(os.path.join(entry, name))}
+        if any(name not in present and name not in optional for name in outputs):
+            return False
+        for name, dest in outputs.items():
+            if name in present:
+                _copy(os.path.join(entry, name), dest)
+        # The entry mtime tracks recency for LRU eviction.
+        os.utime(entry)
+        return True
+
+    def store(self, kind, key, outputs, optional=(), move=False):
+        """
+        Stores `outputs` ({name: src path}) under key, then evicts old entries of this
+        kind. Outputs named in `optional` are skipped if they do not exist. With `move`,
+        the outputs are moved into the cache instead of copied.
+        """
+        kind_dir = os.path.join(self.root, kind)
+        os.makedirs(kind_dir, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=kind_dir)
+        try:
+            for name, src in outputs.items():
+                if name in optional and not os.path.exists(src):
+                    continue
+                if move:
+                    shutil.move(src, os.path.join(tmp, name))
+                else:
+                    _copy(src, os.path.join(tmp, name))
+            os.rename(tmp, os.path.join(kind_dir, key))
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            # Another launcher stored the same entry first.
+            if not os.path.isdir(os.path.join(kind_dir, key)):
+                raise
+        self._evict(kind_dir)
+
+    def _evict(self, kind_dir):
+        entries = [e for e in os.scandir(kind_dir) if e.is_dir() and not e.name.startswith('.')]
+        entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+        for entry in entries[self.max_entries:]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def cache_key(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def hash_sources(repo_dir, pathspecs):
+    """
+    Hashes the paths and contents of every file under `pathspecs` that git can see,
+    tracked or untracked, skipping ignored build outputs.
+    """
+    files = subprocess.run(
+        ['git', 'ls-files', '-z', '--cached', '--others', '--exclude-standard', '--', *pathspecs],
+        cwd=repo_dir, capture_output=True, check=True
+    ).stdout.split(b'\0')
+    h = hashlib.sha256()
+    for name in sorted(set(filter(None, files))):
+        path = os.path.join(repo_dir, os.fsdecode(name))
+        # Skips submodule gitlinks and tracked files deleted from the working tree.
+        if not os.path.isfile(path):
+            continue
+        h.update(name + b'\0')
+        h.update(bytes.fromhex(hash_file(path)))
+    return h.hexdigest()
+
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def command_output(args, cwd=None):
+    """Returns the stdout of a command such as `forge --version`, or '' if it cannot run."""
+    try:
+        return subprocess.run(args, cwd=cwd, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def _copy(src, dest):
+    if os.path.isdir(dest):
+        shutil.rmtree(dest)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    # copyfile gives restored artifacts a fresh mtime, which `make devnet-up` relies on.
+    if os.path.isdir(src):
+        shutil.copytree(src, dest, copy_function=shutil.copyfile)
+    else:
+        shutil.copyfile(src, dest)
@@ -0,0 +1,163 @@
+import codecs
+import json
+import mmap
+import os
+import struct
+
+from devnet.allocs import CHUNK_SIZE, JSONObjectStream, _write_allocs
+
+# A compact allocs file is the minified allocs JSON, followed by an index of the
+# byte range of every account value, sorted by address, and a fixed-size footer:
+#
+#   <minified JSON> <entry>*count <index offset u64> <count u64> <MAGIC>
+#   entry = <address 20 bytes> <value offset u64> <value length u64>
+#
+# The JSON comes first so `head -c <index offset>` yields a valid allocs file, and
+# the index is written last so the file can be produced in a single streaming pass.
+MAGIC = b'DVALLOC1'
+_ENTRY = struct.Struct('<20sQQ')
+_FOOTER = struct.Struct('<QQ8s')
+
+
+def write_compact_allocs(src_path, dest_path, chunk_size=CHUNK_SIZE):
+    """
+    Converts a canonical allocs file, as written by write_anvil_allocs, into the
+    compact format. Accounts are streamed one at a time.
+    """
+    dump = JSONObjectStream(iter_text(src_path, chunk_size))
+    index = []
+    tmp = f'{dest_path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(b'{')
+        first = True
+        for key in dump.keys():
+            f.write((b'' if first else b',') + _minify(key) + b':')
+            first = False
+            if key != 'accounts':
+                f.write(_minify(dump.value()))
+                continue
+            f.write(b'{')
+            for address in dump.keys():
+                f.write((b',' if index else b'') + _minify(address) + b':')
+                value = _minify(dump.value())
+                index.append((_address_bytes(address), f.tell(), len(value)))
+                f.write(value)
+            f.write(b'}')
+        f.write(b'}')
+
+        index_offset = f.tell()
+        index.sort()
+        for i in range(1, len(index)):
+            if index[i][0] == index[i - 1][0]:
+                raise ValueError(f'Duplicate account 0x{index[i][0].hex()} in {src_path}')
+        for entry in index:
+            f.write(_ENTRY.pack(*entry))
+        f.write(_FOOTER.pack(index_offset, len(index), MAGIC))
+    os.replace(tmp, dest_path)
+
+
+def write_canonical_allocs(src_path, dest_path):
+    """
+    Converts a compact allocs file back into the indented JSON that op-node reads.
+    The result is byte-identical to the file it was compacted from.
+    """
+    with CompactAllocs(src_path) as allocs:
+        size = allocs.json_size
+    dump = JSONObjectStream(iter_text(src_path, limit=size))
+    _write_allocs(dump, dest_path, convert=False)
+
+
+def iter_text(path, chunk_size=CHUNK_SIZE, limit=None):
+    """Yields the UTF-8 text of a file in chunks, stopping after `limit` bytes if set."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    remaining = limit
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+    decoder.decode(b'', final=True)
+
+
+class CompactAllocs:
+    """
+    Read-only, memory-mapped view of a compact allocs file. Looking up an account
+    binary-searches the index and decodes only that account.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < _FOOTER.size:
+            self.close()
+            raise ValueError(f'{path} is not a compact allocs file')
+        self.json_size, self._count, magic = _FOOTER.unpack_from(self._mm, len(self._mm) - _FOOTER.size)
+        if magic != MAGIC or self.json_size + self._count * _ENTRY.size + _FOOTER.size != len(self._mm):
+            self.close()
+            raise ValueError(f'{path} is not a compact allocs file')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._mm.close()
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, address):
+        return self._find(address) is not None
+
+    def __getitem__(self, address):
+        entry = self._find(address)
+        if entry is None:
+            raise KeyError(address)
+        return json.loads(self._mm[entry[1]:entry[1] + entry[2]])
+
+    def get(self, address, default=None):
+        try:
+            return self[address]
+        except KeyError:
+            return default
+
+    def addresses(self):
+        """Yields the account addresses in ascending order."""
+        for i in range(self._count):
+            yield '0x' + self._entry(i)[0].hex()
+
+    def _entry(self, i):
+        return _ENTRY.unpack_from(self._mm, self.json_size + i * _ENTRY.size)
+
+    def _find(self, address):
+        key = _address_bytes(address)
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self._entry(mid)
+            if entry[0] < key:
+                lo = mid + 1
+            elif entry[0] > key:
+                hi = mid
+            else:
+                return entry
+        return None
+
+
+def _address_bytes(address):
+    raw = bytes.fromhex(address.removeprefix('0x'))
+    if len(raw) != 20:
+        raise ValueError(f'Invalid account address {address!r}')
+    return raw
+
+
+def _minify(value):
+    return json.dumps(value, separators=(',', ':')).encode()
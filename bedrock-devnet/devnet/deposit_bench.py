@@ -0,0 +1,174 @@
+import concurrent.futures
+import json
+import logging
+import math
+import os
+import subprocess
+import threading
+import time
+
+from devnet import rpc, trace
+
+log = logging.getLogger()
+
+# The hardhat accounts the devnet funds on L1 and L2.
+MNEMONIC = 'test test test test test test test test test test test junk'
+# Accounts 0 - 12 are used by the system, see packages/sdk/hardhat.config.ts.
+FIRST_SIGNER = 13
+FUNDED_SIGNERS = 20
+# Signers past the funded hardhat accounts are funded from FIRST_SIGNER with this much.
+SIGNER_FUNDING = 10 ** 19
+DEPOSIT_VALUE = 10 ** 12
+DEPOSIT_GAS_LIMIT = 200000
+POLL_INTERVAL = 0.25
+
+
+class Deposit:
+    def __init__(self, index, signer, nonce):
+        self.index = index
+        self.signer = signer
+        self.nonce = nonce
+        self.submitted = None
+        self.included = None
+
+    @property
+    def latency(self):
+        return self.included - self.submitted
+
+
+def run_deposit_bench(l1_url, l2_url, portal, signers=4, rate=2.0, count=100, timeout=600):
+    """
+    Sends `count` ETH deposits to the OptimismPortal at `rate` deposits per second,
+    spread round-robin over `signers` accounts, and waits for each to land on L2.
+
+    A deposit is submitted when L1 accepts its transaction, and included once the
+    signer's L2 balance reflects it. Deposits from one signer are derived in nonce
+    order, so the balance tells how many of them are included. Returns the results
+    summary written by write_results.
+    """
+    with trace.span('deposit-bench', 'bench', signers=signers, rate=rate, count=count):
+        indexes = [FIRST_SIGNER + i for i in range(signers)]
+        addresses = [signer_address(i) for i in indexes]
+        fund_signers(l1_url, [(i, a) for i, a in zip(indexes, addresses) if i >= FUNDED_SIGNERS])
+
+        l1 = rpc.client(l1_url)
+        nonces = [int(n, 16) for n in l1.batch([('eth_getTransactionCount', [a, 'pending']) for a in addresses])]
+        deposits = [Deposit(i, i % signers, nonces[i % signers] + i // signers) for i in range(count)]
+        by_signer = [deposits[s::signers] for s in range(signers)]
+        base_balances = _l2_balances(l2_url, addresses)
+
+        log.info(f'Sending {count} deposits from {signers} signers at {rate}/s to {portal}')
+        done = threading.Event()
+        poller = threading.Thread(target=_poll_inclusion, args=(l2_url, addresses, base_balances, by_signer, done))
+        poller.start()
+        start = time.monotonic()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(signers, 4)) as executor:
+                futures = []
+                for d in deposits:
+                    delay = start + d.index / rate - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    futures.append(executor.submit(_submit, l1_url, portal, indexes[d.signer], d))
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+            submitted = time.monotonic()
+            while not done.is_set():
+                if time.monotonic() - submitted > timeout:
+                    raise TimeoutError(f'Timed out after {timeout}s waiting for deposits to reach L2')
+                done.wait(POLL_INTERVAL)
+        finally:
+            done.set()
+            poller.join()
+        return summarize(deposits, signers, rate)
+
+
+def signer_address(index):
+    return subprocess.run(
+        ['cast', 'wallet', 'address', '--mnemonic', MNEMONIC, '--mnemonic-index', str(index)],
+        capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+def fund_signers(l1_url, signers):
+    for index, address in signers:
+        log.info(f'Funding deposit signer {index} ({address})')
+        _cast_send(l1_url, FIRST_SIGNER, address, SIGNER_FUNDING)
+
+
+def _submit(l1_url, portal, signer_index, deposit):
+    # --async returns once the L1 node has accepted the transaction.
+    _cast_send(l1_url, signer_index, portal, DEPOSIT_VALUE, '--async', '--nonce', str(deposit.nonce),
+               '--gas-limit', str(DEPOSIT_GAS_LIMIT))
+    deposit.submitted = time.monotonic()
+
+
+def _cast_send(l1_url, signer_index, to, value, *flags):
+    url = l1_url if '://' in l1_url else f'http://{l1_url}'
+    subprocess.run(
+        ['cast', 'send', '--rpc-url', url, '--mnemonic', MNEMONIC, '--mnemonic-index', str(signer_index),
+         '--value', str(value), *flags, to],
+        capture_output=True, text=True, check=True
+    )
+
+
+def _l2_balances(l2_url, addresses):
+    return [int(b, 16) for b in rpc.client(l2_url).batch([('eth_getBalance', [a, 'latest']) for a in addresses])]
+
+
+def _poll_inclusion(l2_url, addresses, base_balances, by_signer, done):
+    while not done.is_set():
+        try:
+            balances = _l2_balances(l2_url, addresses)
+        except Exception as e:
+            log.warning(f'Polling L2 balances failed: {e}')
+            done.wait(POLL_INTERVAL)
+            continue
+        now = time.monotonic()
+        pending = 0
+        for deposits, base, balance in zip(by_signer, base_balances, balances):
+            included = (balance - base) // DEPOSIT_VALUE
+            for d in deposits[:included]:
+                if d.included is None and d.submitted is not None:
+                    d.included = now
+            pending += sum(1 for d in deposits if d.included is None)
+        if pending == 0:
+            done.set()
+            return
+        done.wait(POLL_INTERVAL)
+
+
+def summarize(deposits, signers, rate):
+    latencies = sorted(d.latency for d in deposits if d.included is not None)
+    first = min(d.submitted for d in deposits)
+    last = max(d.included for d in deposits)
+    return {
+        'signers': signers,
+        'target_rate': rate,
+        'deposits': len(deposits),
+        'deposits_per_second': len(deposits) / (last - first) if last > first else None,
+        'latency_seconds': {
+            'min': latencies[0],
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1],
+        },
+        'poll_interval_seconds': POLL_INTERVAL,
+        **trace.default_metadata(),
+    }
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted `values`."""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def write_results(path, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent='  ')
+    lat = results['latency_seconds']
+    log.info(f'{results["deposits"]} deposits, {results["deposits_per_second"] or 0:.2f}/s sustained, '
+             f'latency p50 {lat["p50"]:.2f}s p95 {lat["p95"]:.2f}s p99 {lat["p99"]:.2f}s')
+    log.info(f'Wrote deposit benchmark results to {path}')
@@ -0,0 +1,63 @@
+"""
+Port and naming layout of devnet instances, so several devnets can run side by side
+on one host. Instance 0 is the default devnet: it uses the ports, `.devnet` dir and
+compose project it always has.
+"""
+
+# Host ports published by ops-bedrock/docker-compose.yml, keyed by the environment
+# variable that overrides them.
+BASE_PORTS = {
+    'L1_RPC_PORT': 8545,
+    'L1_WS_PORT': 8546,
+    'L1_PPROF_PORT': 7060,
+    'L2_RPC_PORT': 9545,
+    'L2_PPROF_PORT': 8060,
+    'OP_NODE_RPC_PORT': 7545,
+    'OP_NODE_P2P_PORT': 9003,
+    'OP_NODE_METRICS_PORT': 7300,
+    'OP_NODE_PPROF_PORT': 6060,
+    'OP_PROPOSER_PPROF_PORT': 6062,
+    'OP_PROPOSER_METRICS_PORT': 7302,
+    'OP_PROPOSER_RPC_PORT': 6546,
+    'OP_BATCHER_PPROF_PORT': 6061,
+    'OP_BATCHER_METRICS_PORT': 7301,
+    'OP_BATCHER_RPC_PORT': 6545,
+    'ARTIFACT_SERVER_PORT': 8080,
+}
+# Each instance shifts every port by this much. No two base ports differ by a
+# multiple of the stride below MAX_INSTANCES strides, so instances never collide.
+# That is checked on import.
+PORT_STRIDE = 100
+MAX_INSTANCES = 10
+
+
+def ports(instance):
+    check_instance(instance)
+    return {name: port + instance * PORT_STRIDE for name, port in BASE_PORTS.items()}
+
+
+def devnet_dir_name(instance):
+    return '.devnet' if instance == 0 else f'.devnet-{instance}'
+
+
+def compose_project(instance):
+    """Returns the docker compose project name, or None for the default project."""
+    return None if instance == 0 else f'ops-bedrock-{instance}'
+
+
+def check_instance(instance):
+    if not 0 <= instance < MAX_INSTANCES:
+        raise ValueError(f'Devnet instance must be between 0 and {MAX_INSTANCES - 1}, got {instance}')
+
+
+def check_port_layout():
+    """Raises if two instances would publish the same host port."""
+    owners = {}
+    for instance in range(MAX_INSTANCES):
+        for name, port in ports(instance).items():
+            other = owners.setdefault(port, (instance, name))
+            if other != (instance, name):
+                raise ValueError(f'Port {port} of instance {instance} {name} collides with instance {other[0]} {other[1]}')
+
+
+check_port_layout()
@@ -1,30 +1,159 @@
+import atexit
+import contextlib
+import copy
+import json
+import logging
+import multiprocessing
 import os
+import queue
+import threading
+import time
 
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
 
 log_level = os.getenv('LOG_LEVEL')
+# 'text' (default) or 'json', for the console.
+log_format = os.getenv('DEVNET_LOG_FORMAT', 'text')
+# Also write JSON lines to this file, rotated at DEVNET_LOG_FILE_MAX_BYTES.
+log_file = os.getenv('DEVNET_LOG_FILE')
+# Hand records to a background thread, so logging never blocks the launcher threads.
+log_async = os.getenv('DEVNET_LOG_ASYNC', '') not in ('', '0', 'false')
+
+_context = threading.local()
+
+
+@contextlib.contextmanager
+def context(**fields):
+    """Adds `fields`, such as the phase or command, to the records logged by this thread in the enclosed block."""
+    saved = getattr(_context, 'fields', {})
+    _context.fields = {**saved, **fields}
+    try:
+        yield
+    finally:
+        _context.fields = saved
+
+
+class ContextFilter(logging.Filter):
+    """
+    Stamps records with the monotonic time and the fields of the logging thread's context.
+    Runs on the handlers, before the queue, so the values are those of the logging thread.
+    """
+
+    def filter(self, record):
+        if not hasattr(record, 'monotonic'):
+            record.monotonic = time.monotonic()
+            fields = getattr(_context, 'fields', {})
+            record.phase = fields.get('phase')
+            record.command = fields.get('command')
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line. `t_ms` is monotonic, so lines from parallel phases sort correctly."""
+
+    def format(self, record):
+        entry = {
+            't_ms': round(record.monotonic * 1000, 3),
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'thread': record.threadName,
+            'phase': record.phase,
+            'command': record.command,
+            'msg': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry)
+
+
+class _QueueHandler(QueueHandler):
+    """
+    Queues records with their message and exception formatted in the logging thread,
+    but kept apart, unlike QueueHandler, so queued JSON lines still have an `exc` field.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
 
 log_config = {
     'version': 1,
     'loggers': {
         '': {
-            'handlers': ['console'],
+            'handlers': ['console'] + (['file'] if log_file else []),
             'level': log_level if log_level is not None else 'INFO'
         },
     },
+    'filters': {
+        'context': {
+            '()': ContextFilter,
+        },
+    },
     'handlers': {
         'console': {
-            'formatter': 'stderr',
+            'formatter': 'json' if log_format == 'json' else 'stderr',
             'class': 'logging.StreamHandler',
-            'stream': 'ext://sys.stdout'
+            'stream': 'ext://sys.stdout',
+            'filters': ['context'],
         }
     },
     'formatters': {
         'stderr': {
             'format': '[%(levelname)s|%(asctime)s] %(message)s',
             'datefmt': '%m-%d-%Y %I:%M:%S'
-        }
+        },
+        'json': {
+            '()': JSONFormatter,
+        },
     },
 }
 
+if log_file:
+    log_config['handlers']['file'] = {
+        'formatter': 'json',
+        'class': 'logging.handlers.RotatingFileHandler',
+        'filename': log_file,
+        'maxBytes': int(os.getenv('DEVNET_LOG_FILE_MAX_BYTES', 50 * 1024 * 1024)),
+        'backupCount': int(os.getenv('DEVNET_LOG_FILE_BACKUPS', 3)),
+        'filters': ['context'],
+    }
+
 dictConfig(log_config)
+
+
+def _start_queue():
+    """Moves the root handlers behind a queue, drained by a listener thread until exit."""
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    records = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(ContextFilter())
+    for h in handlers:
+        root.removeHandler(h)
+    root.addHandler(handler)
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    def log_directly():
+        # The listener thread does not survive a fork, so forked children log synchronously.
+        root.removeHandler(handler)
+        for h in handlers:
+            root.addHandler(h)
+
+    os.register_at_fork(after_in_child=log_directly)
+
+
+# Child processes log synchronously: they exit with os._exit, skipping the atexit
+# hook that drains the queue, so their last records, often the error, would be lost.
+if log_async and multiprocessing.current_process().name == 'MainProcess':
+    _start_queue()
@@ -0,0 +1,59 @@
+import os
+import selectors
+import time
+
+READ_SIZE = 1 << 16
+
+
+def iter_lines(proc, deadline=None):
+    """
+    Yields (stream, line) pairs from the stdout and stderr pipes of `proc` as they
+    arrive, where stream is proc.stdout or proc.stderr and line is decoded text.
+
+    Both pipes are drained together, so a process that writes a lot to one of them
+    never blocks on a full pipe. Raises TimeoutError once time.monotonic() passes
+    `deadline`, if set.
+    """
+    pending = {}
+    with selectors.DefaultSelector() as sel:
+        for stream in (proc.stdout, proc.stderr):
+            if stream is not None:
+                sel.register(stream, selectors.EVENT_READ)
+                pending[stream] = b''
+        while sel.get_map():
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    raise TimeoutError()
+            for key, _ in sel.select(timeout):
+                stream = key.fileobj
+                data = os.read(key.fd, READ_SIZE)
+                if not data:
+                    sel.unregister(stream)
+                    if pending[stream]:
+                        yield stream, pending[stream].decode(errors='replace')
+                    continue
+                lines = (pending[stream] + data).split(b'\n')
+                pending[stream] = lines.pop()
+                for line in lines:
+                    yield stream, line.decode(errors='replace') + '\n'
+
+
+class Timestamps:
+    """
+    Formats wall-clock times as HH:MM:SS.ffffff (UTC). The seconds part is only
+    re-formatted when the second changes, which keeps per-line stamping cheap.
+    """
+
+    def __init__(self):
+        self._second = None
+        self._prefix = ''
+
+    def now(self):
+        t = time.time()
+        second = int(t)
+        if second != self._second:
+            self._second = second
+            self._prefix = time.strftime('%H:%M:%S', time.gmtime(second))
+        return f'{self._prefix}.{int((t - second) * 1e6):06d}'
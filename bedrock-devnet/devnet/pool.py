@@ -0,0 +1,245 @@
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from devnet import instance, readiness
+
+log = logging.getLogger()
+
+# Instance states. An instance is booted, handed out while ready, marked dirty when
+# its lease ends, and then reset and booted again.
+BOOTING = 'booting'
+READY = 'ready'
+LEASED = 'leased'
+DIRTY = 'dirty'
+BROKEN = 'broken'
+
+POLL_INTERVAL = 1.0
+HEALTH_DEADLINE = 5
+# Seconds before a broken instance is booted again.
+BROKEN_RETRY = 60
+BOOT_TIMEOUT = 30 * 60
+
+
+class PoolError(Exception):
+    pass
+
+
+class DevnetPool:
+    """
+    Keeps devnet instances 1..size booted, so test runs can lease a ready devnet
+    instead of booting one. Instance 0 is left to the default devnet.
+
+    The pool state is one JSON file per instance under `root`, updated under an
+    exclusive lock, so any number of processes can acquire and release leases while
+    a single `maintain` loop boots and resets instances.
+    """
+
+    def __init__(self, root, monorepo_dir, size):
+        if not 0 < size < instance.MAX_INSTANCES:
+            raise PoolError(f'Pool size must be between 1 and {instance.MAX_INSTANCES - 1}, got {size}')
+        self.root = root
+        self.monorepo_dir = monorepo_dir
+        self.size = size
+        os.makedirs(root, exist_ok=True)
+
+    def instances(self):
+        return range(1, self.size + 1)
+
+    def status(self):
+        with self._lock():
+            return {n: self._read(n) for n in self.instances()}
+
+    def acquire(self, timeout=None, owner=None):
+        """
+        Leases a ready, healthy instance, waiting up to `timeout` seconds for one.
+        Returns the lease, a dict with the instance number and its endpoints.
+
+        The lease is held by the process `owner`, this process by default. If the
+        owner exits without releasing it, the maintain loop resets the instance.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            lease = self._try_acquire(owner or os.getpid())
+            if lease is not None:
+                return lease
+            if deadline is not None and time.monotonic() >= deadline:
+                raise PoolError(f'No devnet became ready within {timeout}s')
+            time.sleep(POLL_INTERVAL)
+
+    def release(self, n):
+        with self._lock():
+            state = self._read(n)
+            if state['state'] != LEASED:
+                raise PoolError(f'Devnet instance {n} is not leased')
+            self._write(n, DIRTY)
+        log.info(f'Released devnet instance {n}')
+
+    @contextlib.contextmanager
+    def lease(self, timeout=None):
+        lease = self.acquire(timeout)
+        try:
+            yield lease
+        finally:
+            self.release(lease['instance'])
+
+    def maintain(self, stop=None, workers=None):
+        """
+        Boots every instance that is not ready or leased, and resets dirty, broken and
+        abandoned ones, until `stop` is set. Instances boot concurrently.
+
+        The docker images are built once up front, so boots and refills skip the build.
+        """
+        stop = stop or threading.Event()
+        self.build_images()
+        busy = {}
+        while not stop.is_set():
+            for n, thread in list(busy.items()):
+                if not thread.is_alive():
+                    del busy[n]
+            with self._lock():
+                for n in self.instances():
+                    if n in busy:
+                        continue
+                    state = self._read(n)
+                    if state['state'] == READY or (state['state'] == LEASED and _alive(state['owner'])):
+                        continue
+                    if state['state'] == BROKEN and time.time() - state['since'] < BROKEN_RETRY:
+                        continue
+                    if workers is not None and len(busy) >= workers:
+                        break
+                    if state['state'] == LEASED:
+                        log.warning(f'Lease holder {state["owner"]} of devnet instance {n} exited, resetting it')
+                    self._write(n, BOOTING)
+                    busy[n] = threading.Thread(target=self._refill, args=(n,), daemon=True)
+                    busy[n].start()
+            stop.wait(POLL_INTERVAL)
+
+    def build_images(self):
+        """
+        Builds the docker images of every instance. Images without a fixed name are
+        named after the compose project, so each instance needs its own, but only the
+        first build does real work, the others hit the docker build cache.
+        """
+        log_path = os.path.join(self.root, 'build.log')
+        start = time.monotonic()
+        with open(log_path, 'w') as out:
+            for n in self.instances():
+                try:
+                    subprocess.run(self._main_args(n) + ['--build-images'], stdout=out, stderr=subprocess.STDOUT,
+                                   check=True, timeout=BOOT_TIMEOUT)
+                except subprocess.SubprocessError as e:
+                    raise PoolError(f'Building the docker images of devnet instance {n} failed, see {log_path}: {e}')
+        log.info(f'Built the devnet docker images in {time.monotonic() - start:.1f}s')
+
+    def _try_acquire(self, owner):
+        with self._lock():
+            n = next((n for n in self.instances() if self._read(n)['state'] == READY), None)
+            if n is None:
+                return None
+            self._write(n, LEASED, owner=owner)
+        # Checked outside the lock, since it can take HEALTH_DEADLINE seconds.
+        if not self._healthy(n):
+            log.warning(f'Devnet instance {n} failed its health check')
+            with self._lock():
+                self._write(n, BROKEN, error='health check failed')
+            return None
+        log.info(f'Leased devnet instance {n}')
+        return endpoints(n)
+
+    def _refill(self, n):
+        log_path = os.path.join(self.root, f'instance-{n}.log')
+        start = time.monotonic()
+        try:
+            with open(log_path, 'w') as out:
+                self._reset(n, out)
+                self._boot(n, out)
+        except Exception as e:
+            log.error(f'Booting devnet instance {n} failed, see {log_path}: {e}')
+            with self._lock():
+                self._write(n, BROKEN, error=str(e))
+            return
+        with self._lock():
+            self._write(n, READY)
+        log.info(f'Devnet instance {n} ready after {time.monotonic() - start:.1f}s')
+
+    def _reset(self, n, out):
+        # Drop the containers and chain volumes. The generated genesis files in the
+        # instance dir are kept, so the next boot restores them instead of rebuilding.
+        subprocess.run(
+            ['docker', 'compose', '-p', instance.compose_project(n), 'down', '-v', '--remove-orphans'],
+            cwd=os.path.join(self.monorepo_dir, 'ops-bedrock'), stdout=out, stderr=subprocess.STDOUT, check=True
+        )
+
+    def _boot(self, n, out):
+        subprocess.run(
+            self._main_args(n), env={**os.environ, 'DEVNET_NO_BUILD': 'true'},
+            stdout=out, stderr=subprocess.STDOUT, check=True, timeout=BOOT_TIMEOUT
+        )
+
+    def _main_args(self, n):
+        main = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+        return [sys.executable, main, '--monorepo-dir', self.monorepo_dir, '--instance', str(n)]
+
+    def _healthy(self, n):
+        e = endpoints(n)
+        try:
+            readiness.wait_ready(
+                readiness.rpc(e['l1_rpc'], deadline=HEALTH_DEADLINE),
+                readiness.rpc(e['l2_rpc'], deadline=HEALTH_DEADLINE),
+                readiness.op_node_synced(e['op_node_rpc'], deadline=HEALTH_DEADLINE),
+            )
+            return True
+        except TimeoutError:
+            return False
+
+    @contextlib.contextmanager
+    def _lock(self):
+        with open(os.path.join(self.root, 'pool.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _state_path(self, n):
+        return os.path.join(self.root, f'instance-{n}.json')
+
+    def _read(self, n):
+        try:
+            with open(self._state_path(n)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'state': None}
+
+    def _write(self, n, state, **fields):
+        path = self._state_path(n)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump({'state': state, 'since': int(time.time()), **fields}, f)
+        os.replace(f'{path}.tmp', path)
+
+
+def endpoints(n):
+    ports = instance.ports(n)
+    return {
+        'instance': n,
+        'l1_rpc': f'127.0.0.1:{ports["L1_RPC_PORT"]}',
+        'l2_rpc': f'127.0.0.1:{ports["L2_RPC_PORT"]}',
+        'op_node_rpc': f'127.0.0.1:{ports["OP_NODE_RPC_PORT"]}',
+        'devnet_dir': instance.devnet_dir_name(n),
+    }
+
+
+def _alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import random
+import time
+
+from devnet import trace
+from devnet.rpc import client as rpc_client
+
+log = logging.getLogger()
+
+DEFAULT_DEADLINE = 300
+INITIAL_BACKOFF = 0.01
+MAX_BACKOFF = 1.0
+ATTEMPT_TIMEOUT = 5
+
+
+class Probe:
+    """
+    A readiness check against one endpoint. `check` is a coroutine function that
+    returns truthy once the endpoint is ready; returning falsy or raising means not
+    ready yet. The probe gives up `deadline` seconds after waiting starts.
+    """
+
+    def __init__(self, name, check, deadline=DEFAULT_DEADLINE):
+        self.name = name
+        self.check = check
+        self.deadline = deadline
+
+
+def tcp(host, port, deadline=DEFAULT_DEADLINE):
+    async def check():
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), ATTEMPT_TIMEOUT)
+        writer.close()
+        await writer.wait_closed()
+        return True
+    return Probe(f'{host}:{port}', check, deadline)
+
+
+def rpc(url, method='eth_chainId', deadline=DEFAULT_DEADLINE):
+    async def check():
+        await _rpc(url, method)
+        return True
+    return Probe(f'{url} {method}', check, deadline)
+
+
+def block_advancing(url, blocks=1, deadline=DEFAULT_DEADLINE):
+    """Ready once eth_blockNumber has advanced `blocks` past the first height observed."""
+    first = None
+
+    async def check():
+        nonlocal first
+        number = int(await _rpc(url, 'eth_blockNumber'), 16)
+        if first is None:
+            first = number
+        return number - first >= blocks
+    return Probe(f'{url} blocks advancing', check, deadline)
+
+
+def op_node_synced(url, deadline=DEFAULT_DEADLINE):
+    """Ready once the op-node reports an unsafe L2 head past genesis."""
+    async def check():
+        status = await _rpc(url, 'optimism_syncStatus')
+        return status['unsafe_l2']['number'] > 0
+    return Probe(f'{url} op-node sync', check, deadline)
+
+
+def wait_ready(*probes):
+    """Waits for all probes concurrently. Raises TimeoutError if any misses its deadline."""
+    asyncio.run(_wait_all(probes))
+
+
+async def _wait_all(probes):
+    tasks = [asyncio.create_task(_wait(p)) for p in probes]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _wait(probe):
+    with trace.span(probe.name, 'wait', concurrent=True):
+        await _poll(probe)
+
+
+async def _poll(probe):
+    log.info(f'Waiting for {probe.name}')
+    start = time.monotonic()
+    deadline = start + probe.deadline
+    backoff = INITIAL_BACKOFF
+    last_err = None
+    while True:
+        try:
+            if await probe.check():
+                log.info(f'{probe.name} ready after {time.monotonic() - start:.3f}s')
+                return
+            last_err = None
+        except Exception as e:
+            last_err = e
+        now = time.monotonic()
+        if now >= deadline:
+            reason = f': {last_err}' if last_err is not None else ''
+            raise TimeoutError(f'Timed out after {probe.deadline}s waiting for {probe.name}{reason}')
+        # Jittered exponential backoff, never sleeping past the deadline.
+        await asyncio.sleep(min(backoff * random.uniform(0.5, 1.0), deadline - now))
+        backoff = min(backoff * 2, MAX_BACKOFF)
+
+
+async def _rpc(url, method, params=None):
+    return await asyncio.to_thread(_rpc_sync, url, method, params or [])
+
+
+def _rpc_sync(url, method, params):
+    return rpc_client(url).call(method, *params, timeout=ATTEMPT_TIMEOUT)
@@ -0,0 +1,182 @@
+import contextlib
+import http.client
+import itertools
+import json
+import os
+import queue
+import threading
+import urllib.parse
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_POOL_SIZE = 4
+# geth rejects batches with more than 1000 requests by default.
+MAX_BATCH_SIZE = 1000
+
+_HEADERS = {'Content-type': 'application/json'}
+# Errors that mean a pooled keep-alive connection was closed by the server while idle.
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+
+class RPCError(Exception):
+    def __init__(self, method, error):
+        self.method = method
+        self.code = error.get('code')
+        self.data = error.get('data')
+        super().__init__(f'{method} failed ({self.code}): {error.get("message")}')
+
+
+class RPCClient:
+    """
+    Thread-safe JSON-RPC client that keeps a pool of keep-alive HTTP connections
+    to a single endpoint.
+
+    `url` is either a full http:// URL or a bare host:port, as used by the launcher.
+    """
+
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE):
+        parsed = urllib.parse.urlsplit(url if '://' in url else f'http://{url}')
+        self.url = url
+        self.timeout = timeout
+        self._host = parsed.netloc
+        self._path = parsed.path or '/'
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._ids = itertools.count(1)
+
+    def call(self, method, *params, timeout=None):
+        req = self._request(method, params)
+        res = json.loads(self._post(json.dumps(req), timeout))
+        return _result(method, res)
+
+    def batch(self, calls, timeout=None, return_errors=False):
+        """
+        Sends (method, params) pairs as JSON-RPC batches and returns their results in
+        order. A failed call raises its RPCError, or with `return_errors` is returned
+        in place of its result.
+        """
+        results = []
+        for start in range(0, len(calls), MAX_BATCH_SIZE):
+            chunk = calls[start:start + MAX_BATCH_SIZE]
+            reqs = [self._request(method, params) for method, params in chunk]
+            res = json.loads(self._post(json.dumps(reqs), timeout))
+            if isinstance(res, dict):
+                # Some servers answer an unsupported batch with a single error object.
+                raise RPCError('batch', res.get('error', {}))
+            by_id = {r.get('id'): r for r in res}
+            for req in reqs:
+                r = by_id.get(req['id'], {'error': {'message': 'missing from batch response'}})
+                try:
+                    results.append(_result(req['method'], r))
+                except RPCError as e:
+                    if not return_errors:
+                        raise
+                    results.append(e)
+        return results
+
+    @contextlib.contextmanager
+    def stream(self, method, *params, timeout=None):
+        """
+        Sends a call and yields the raw HTTP response, so large results such as
+        anvil_dumpState can be read incrementally instead of buffered.
+        """
+        conn, response = self._send(json.dumps(self._request(method, params)), timeout)
+        try:
+            if response.status >= 300:
+                raise RuntimeError(f'{method} failed with HTTP {response.status}: {response.read()[:1024]!r}')
+            yield response
+        finally:
+            if response.isclosed() and not response.will_close:
+                self._release(conn)
+            else:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _request(self, method, params):
+        return {'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': list(params)}
+
+    def _post(self, body, timeout):
+        conn, response = self._send(body, timeout)
+        try:
+            data = response.read()
+        except Exception:
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(conn)
+        if response.status >= 300:
+            raise RuntimeError(f'HTTP {response.status} from {self.url}: {data[:1024]!r}')
+        return data
+
+    def _send(self, body, timeout):
+        timeout = timeout or self.timeout
+        conn, reused = self._acquire(timeout)
+        try:
+            conn.request('POST', self._path, body, _HEADERS)
+            return conn, conn.getresponse()
+        except _STALE_CONNECTION_ERRORS:
+            conn.close()
+            if not reused:
+                raise
+        except Exception:
+            conn.close()
+            raise
+        # The server dropped an idle connection before reading the request; retry on a fresh one.
+        conn = http.client.HTTPConnection(self._host, timeout=timeout)
+        try:
+            conn.request('POST', self._path, body, _HEADERS)
+            return conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    def _acquire(self, timeout):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            return http.client.HTTPConnection(self._host, timeout=timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+def _result(method, res):
+    if 'error' in res:
+        raise RPCError(method, res['error'])
+    return res['result']
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client(url):
+    """Returns the shared client for `url`, so the launcher reuses connections across steps."""
+    with _clients_lock:
+        c = _clients.get(url)
+        if c is None:
+            c = _clients[url] = RPCClient(url)
+        return c
+
+
+def _reset_after_fork():
+    # Pooled sockets must not be shared between a forked child and its parent.
+    global _clients_lock
+    _clients.clear()
+    _clients_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
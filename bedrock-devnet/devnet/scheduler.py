@@ -0,0 +1,152 @@
+import concurrent.futures
+import logging
+import time
+
+from devnet import trace
+
+log = logging.getLogger()
+
+DEFAULT_WORKERS = 4
+
+
+class Phase:
+    """
+    A unit of devnet bring-up. A phase runs once every phase that produces one of
+    its `inputs` has finished, and itself produces `outputs`.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=()):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+
+
+class PhaseError(Exception):
+    def __init__(self, phase, cause):
+        super().__init__(f'Phase {phase} failed: {cause}')
+        self.phase = phase
+
+
+class PhaseTiming:
+    def __init__(self, name, start, end, deps):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.deps = deps
+        self.critical = False
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+def run_phases(phases, max_workers=DEFAULT_WORKERS):
+    """
+    Runs `phases` on a worker pool, starting each as soon as its dependencies are done.
+
+    If a phase fails, no further phases are started, the running ones are allowed
+    to finish and a PhaseError is raised for the first failure. Returns the phase
+    timings, with the critical path marked, in start order.
+    """
+    deps = phase_dependencies(phases)
+    by_name = {p.name: p for p in phases}
+    pending = dict(deps)
+    timings = {}
+    failure = None
+    origin = time.monotonic()
+
+    def run(phase):
+        start = time.monotonic() - origin
+        try:
+            with trace.span(phase.name, 'phase'):
+                phase.func()
+        finally:
+            timings[phase.name] = PhaseTiming(phase.name, start, time.monotonic() - origin, deps[phase.name])
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while pending or running:
+            if failure is None:
+                for name in [n for n, d in pending.items() if all(dep in timings and dep not in running.values() for dep in d)]:
+                    del pending[name]
+                    log.info(f'Starting phase {name}')
+                    running[executor.submit(run, by_name[name])] = name
+            if not running:
+                break
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                err = future.exception()
+                if err is None:
+                    log.info(f'Finished phase {name} in {timings[name].duration:.2f}s')
+                elif failure is None:
+                    log.error(f'Phase {name} failed: {err}')
+                    failure = PhaseError(name, err)
+                    failure.__cause__ = err
+                    if pending:
+                        log.error(f'Not starting phases: {", ".join(pending)}')
+                else:
+                    log.error(f'Phase {name} also failed: {err}')
+
+    result = sorted(timings.values(), key=lambda t: t.start)
+    mark_critical_path(result)
+    log_phase_timings(result)
+    if failure is not None:
+        raise failure
+    return result
+
+
+def phase_dependencies(phases):
+    """Returns {phase name: set of phase names it depends on}, derived from inputs and outputs."""
+    producers = {}
+    for phase in phases:
+        for output in phase.outputs:
+            if output in producers:
+                raise ValueError(f'{output} is produced by both {producers[output]} and {phase.name}')
+            producers[output] = phase.name
+
+    deps = {}
+    for phase in phases:
+        missing = [i for i in phase.inputs if i not in producers]
+        if missing:
+            raise ValueError(f'Phase {phase.name} needs {", ".join(missing)}, which no phase produces')
+        deps[phase.name] = {producers[i] for i in phase.inputs}
+
+    # Reject cycles up front, otherwise the scheduler would wait forever.
+    visiting, visited = set(), set()
+
+    def visit(name):
+        if name in visited:
+            return
+        if name in visiting:
+            raise ValueError(f'Phase dependency cycle through {name}')
+        visiting.add(name)
+        for dep in deps[name]:
+            visit(dep)
+        visiting.discard(name)
+        visited.add(name)
+
+    for name in deps:
+        visit(name)
+    return deps
+
+
+def mark_critical_path(timings):
+    # Walk back from the last phase to finish, always through the dependency that finished last.
+    by_name = {t.name: t for t in timings}
+    current = max(timings, key=lambda t: t.end, default=None)
+    while current is not None:
+        current.critical = True
+        deps = [by_name[d] for d in current.deps if d in by_name]
+        current = max(deps, key=lambda t: t.end, default=None)
+
+
+def log_phase_timings(timings):
+    if not timings:
+        return
+    log.info(f'{"phase":<20} {"start":>8} {"duration":>9}')
+    for t in timings:
+        log.info(f'{t.name:<20} {t.start:>7.2f}s {t.duration:>8.2f}s{" *" if t.critical else ""}')
+    critical = [t for t in timings if t.critical]
+    log.info(f'Critical path ({sum(t.duration for t in critical):.2f}s): {" -> ".join(t.name for t in critical)}')
@@ -0,0 +1,116 @@
+import io
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+
+from devnet.cache import hash_file
+
+log = logging.getLogger()
+
+# Bump when the bundle layout changes, so stale bundles are rejected instead of misread.
+SNAPSHOT_VERSION = 1
+MANIFEST = 'manifest.json'
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def save_snapshot(bundle_path, entries, metadata=None):
+    """
+    Writes a post-deployment L1 snapshot bundle to `bundle_path`.
+
+    `entries` maps bundle entry names to files or directories, for example the allocs,
+    addresses.json, the deployment dir and the raw anvil state. Every file is recorded
+    in the manifest with its sha256, so a restore can detect a damaged bundle.
+    """
+    files = {}
+    for name, src in entries.items():
+        for rel, path in _walk(name, src):
+            files[rel] = hash_file(path)
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'created_at': int(time.time()),
+        'entries': sorted(entries),
+        'files': files,
+        **(metadata or {}),
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(bundle_path)), exist_ok=True)
+    tmp = f'{bundle_path}.tmp'
+    with tarfile.open(tmp, 'w:gz', compresslevel=1) as tar:
+        data = json.dumps(manifest, indent='  ').encode()
+        info = tarfile.TarInfo(MANIFEST)
+        info.size = len(data)
+        info.mtime = manifest['created_at']
+        tar.addfile(info, io.BytesIO(data))
+        for name, src in entries.items():
+            tar.add(src, arcname=name)
+    os.replace(tmp, bundle_path)
+    log.info(f'Saved snapshot with {len(files)} files to {bundle_path}')
+    return manifest
+
+
+def read_manifest(bundle_path):
+    with tarfile.open(bundle_path, 'r:*') as tar:
+        return _check_version(bundle_path, json.load(tar.extractfile(MANIFEST)))
+
+
+def restore_snapshot(bundle_path, entries):
+    """
+    Restores the bundle entries named in `entries` ({name: dest path}) into place.
+    Raises SnapshotError if the bundle has another version, lacks an entry, or
+    fails its checksums.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        with tarfile.open(bundle_path, 'r:*') as tar:
+            manifest = _check_version(bundle_path, json.load(tar.extractfile(MANIFEST)))
+            missing = [name for name in entries if name not in manifest['entries']]
+            if missing:
+                raise SnapshotError(f'Snapshot {bundle_path} has no {", ".join(missing)}')
+            members = [m for m in tar.getmembers() if m.name.split('/')[0] in entries]
+            # Use the safe extraction filter where this Python version has it.
+            kwargs = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+            tar.extractall(tmp, members=members, **kwargs)
+
+        for name, dest in entries.items():
+            src = os.path.join(tmp, name)
+            for rel, path in _walk(name, src):
+                if manifest['files'].get(rel) != hash_file(path):
+                    raise SnapshotError(f'Snapshot {bundle_path} is corrupt: checksum mismatch for {rel}')
+            if os.path.isdir(dest):
+                shutil.rmtree(dest)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.move(src, dest)
+    log.info(f'Restored {", ".join(entries)} from snapshot {bundle_path}')
+    return manifest
+
+
+def extract_file(bundle_path, name):
+    """Returns the bytes of a single-file entry, such as the raw anvil state."""
+    with tarfile.open(bundle_path, 'r:*') as tar:
+        _check_version(bundle_path, json.load(tar.extractfile(MANIFEST)))
+        try:
+            return tar.extractfile(name).read()
+        except KeyError:
+            raise SnapshotError(f'Snapshot {bundle_path} has no {name}')
+
+
+def _check_version(bundle_path, manifest):
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        raise SnapshotError(f'Snapshot {bundle_path} has version {manifest.get("version")}, expected {SNAPSHOT_VERSION}')
+    return manifest
+
+
+def _walk(name, src):
+    if not os.path.isdir(src):
+        yield name, src
+        return
+    for root, _, files in os.walk(src):
+        for f in files:
+            path = os.path.join(root, f)
+            yield os.path.join(name, os.path.relpath(path, src)).replace(os.sep, '/'), path
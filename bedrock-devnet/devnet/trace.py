@@ -0,0 +1,128 @@
+import contextlib
+import itertools
+import json
+import logging
+import os
+import socket
+import subprocess
+import threading
+import time
+
+from devnet import log_setup
+
+log = logging.getLogger()
+
+# Span categories that name the phase or command of log records in their block.
+LOG_FIELDS = {'phase': 'phase', 'command': 'command', 'test': 'command'}
+
+
+class Span:
+    def __init__(self, name, cat, start, end, pid, tid, args, async_id=None):
+        self.name = name
+        self.cat = cat
+        self.start = start
+        self.end = end
+        self.pid = pid
+        self.tid = tid
+        self.args = args
+        self.async_id = async_id
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class Tracer:
+    """
+    Records timed spans for devnet phases, commands and waits.
+
+    Timestamps come from time.monotonic(), which is system-wide on Linux and macOS,
+    so spans recorded in child processes can be merged in with add().
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+        self._async_ids = itertools.count(1)
+
+    @contextlib.contextmanager
+    def span(self, name, cat, concurrent=False, **args):
+        """
+        Times the enclosed block. Set `concurrent` for spans that overlap others on
+        the same thread, such as asyncio tasks, so they are exported as async events.
+        """
+        field = None if concurrent else LOG_FIELDS.get(cat)
+        start = time.monotonic()
+        try:
+            with log_setup.context(**{field: name}) if field else contextlib.nullcontext():
+                yield args
+        except BaseException as e:
+            args['error'] = str(e)
+            raise
+        finally:
+            async_id = next(self._async_ids) if concurrent else None
+            self.add([Span(name, cat, start, time.monotonic(), os.getpid(), threading.get_ident(), args, async_id)])
+
+    def add(self, spans):
+        with self._lock:
+            self.spans.extend(spans)
+
+    def export_chrome(self, path, metadata=None):
+        """Writes the spans in the Chrome trace-event format, loadable in chrome://tracing or Perfetto."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        origin = spans[0].start if spans else 0
+        events = []
+        for s in spans:
+            ts = round((s.start - origin) * 1e6)
+            common = {'name': s.name, 'cat': s.cat, 'pid': s.pid, 'tid': s.tid, 'args': s.args}
+            if s.async_id is None:
+                events.append({**common, 'ph': 'X', 'ts': ts, 'dur': round(s.duration * 1e6)})
+            else:
+                events.append({**common, 'ph': 'b', 'ts': ts, 'id': s.async_id})
+                events.append({**common, 'ph': 'e', 'ts': ts + round(s.duration * 1e6), 'id': s.async_id})
+        with open(path, 'w') as f:
+            json.dump({
+                'traceEvents': events,
+                'displayTimeUnit': 'ms',
+                'otherData': {**default_metadata(), **(metadata or {})},
+            }, f)
+
+    def summary(self):
+        """Returns (cat, name, count, total seconds, max seconds) rows, longest total first."""
+        with self._lock:
+            spans = list(self.spans)
+        rows = {}
+        for s in spans:
+            count, total, longest = rows.get((s.cat, s.name), (0, 0.0, 0.0))
+            rows[(s.cat, s.name)] = (count + 1, total + s.duration, max(longest, s.duration))
+        return sorted(((cat, name, *v) for (cat, name), v in rows.items()), key=lambda r: r[3], reverse=True)
+
+    def log_summary(self):
+        rows = self.summary()
+        if not rows:
+            return
+        width = min(max(len(r[1]) for r in rows), 60)
+        log.info(f'{"cat":<8} {"span":<{width}} {"count":>5} {"total":>9} {"max":>9}')
+        for cat, name, count, total, longest in rows:
+            log.info(f'{cat:<8} {name[:width]:<{width}} {count:>5} {total:>8.2f}s {longest:>8.2f}s')
+
+
+def default_metadata():
+    return {
+        'host': socket.gethostname(),
+        'cpus': os.cpu_count(),
+        'git_commit': _git_commit(),
+        'recorded_at': int(time.time()),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+tracer = Tracer()
+span = tracer.span
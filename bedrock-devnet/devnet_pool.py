@@ -0,0 +1,78 @@
+"""
+Keeps a pool of booted devnets and leases them to test runs. Run from this
+directory, or with PYTHONPATH set to it:
+
+    python3 devnet_pool.py --monorepo-dir=.. --size=4 serve
+    python3 devnet_pool.py --monorepo-dir=.. run -- make devnet-test
+
+`run` leases a ready devnet, runs the command with DEVNET_INSTANCE and the devnet
+endpoints in its environment, and releases the devnet when the command exits. The
+`serve` loop then resets the released devnet and boots it again in the background.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import devnet.log_setup
+from devnet.pool import DevnetPool, PoolError
+
+parser = argparse.ArgumentParser(description='Warm devnet pool')
+parser.add_argument('--monorepo-dir', help='Directory of the monorepo', default=os.getcwd())
+parser.add_argument('--size', help='Number of devnets to keep booted', type=int, default=int(os.getenv('DEVNET_POOL_SIZE') or 2))
+parser.add_argument('--pool-dir', help='Directory of the pool state, defaults to <monorepo>/.devnet-pool')
+commands = parser.add_subparsers(dest='command', required=True)
+
+serve = commands.add_parser('serve', help='Boot the pool and keep it refilled until interrupted')
+serve.add_argument('--workers', help='Number of devnets to boot at once', type=int)
+
+acquire = commands.add_parser('acquire', help='Lease a devnet and print its endpoints as JSON')
+acquire.add_argument('--timeout', help='Seconds to wait for a ready devnet', type=float)
+acquire.add_argument('--owner', help='PID that holds the lease, defaults to the calling shell', type=int)
+
+release = commands.add_parser('release', help='Return a leased devnet to the pool')
+release.add_argument('instance', type=int)
+
+commands.add_parser('status', help='Print the state of every devnet in the pool as JSON')
+
+run = commands.add_parser('run', help='Run a command against a leased devnet')
+run.add_argument('--timeout', help='Seconds to wait for a ready devnet', type=float)
+run.add_argument('args', nargs=argparse.REMAINDER)
+
+
+def main():
+    args = parser.parse_args()
+    monorepo_dir = os.path.abspath(args.monorepo_dir)
+    pool = DevnetPool(args.pool_dir or os.path.join(monorepo_dir, '.devnet-pool'), monorepo_dir, args.size)
+    try:
+        if args.command == 'serve':
+            try:
+                pool.maintain(workers=args.workers)
+            except KeyboardInterrupt:
+                pass
+        elif args.command == 'acquire':
+            print(json.dumps(pool.acquire(args.timeout, args.owner or os.getppid())))
+        elif args.command == 'release':
+            pool.release(args.instance)
+        elif args.command == 'status':
+            print(json.dumps(pool.status(), indent='  '))
+        else:
+            cmd = args.args[1:] if args.args[:1] == ['--'] else args.args
+            if not cmd:
+                parser.error('run needs a command')
+            with pool.lease(args.timeout) as lease:
+                env = {
+                    **os.environ,
+                    'DEVNET_INSTANCE': str(lease['instance']),
+                    'DEVNET_L1_RPC': f'http://{lease["l1_rpc"]}',
+                    'DEVNET_L2_RPC': f'http://{lease["l2_rpc"]}',
+                    'DEVNET_OP_NODE_RPC': f'http://{lease["op_node_rpc"]}',
+                }
+                sys.exit(subprocess.run(cmd, env=env).returncode)
+    except PoolError as e:
+        sys.exit(str(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Tests of anvil_dumpState ingestion. Run from this directory:
+
+    python3 -m unittest test_allocs
+"""
+import gzip
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from devnet.allocs import convert_anvil_dump, write_anvil_allocs
+
+
+def make_dump(accounts=20, slots=30):
+    return {
+        'block': {'number': '0x1'},
+        'accounts': {
+            '0x%040x' % (i + 1): {
+                'nonce': i,
+                'balance': hex(10 ** 18 + i),
+                'code': '0x6080',
+                'storage': {hex(i * slots + j): hex(j + 1) for j in range(slots)},
+            }
+            for i in range(accounts)
+        },
+    }
+
+
+def make_response(compressed):
+    return b'{"jsonrpc":"2.0","id":1,"result":"0x' + compressed.hex().encode() + b'"}'
+
+
+class WriteAnvilAllocsTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.allocs_path = os.path.join(tmp.name, 'allocs.json')
+        self.state_path = os.path.join(tmp.name, 'anvil-state.gz')
+
+    def ingest(self, response, chunk_size):
+        write_anvil_allocs(io.BytesIO(response), self.allocs_path, self.state_path, chunk_size=chunk_size)
+
+    def test_round_trip(self):
+        dump = make_dump()
+        text = json.dumps(dump).encode() + b'\n'
+        compressed = gzip.compress(text, mtime=0)
+        expected = json.dumps(convert_anvil_dump(make_dump()), indent='  ')
+        for chunk_size in [1, 2, 3, 7, 16, 61, 256, 4096, 1 << 16]:
+            with self.subTest(chunk_size=chunk_size):
+                self.ingest(make_response(compressed), chunk_size)
+                with open(self.allocs_path) as f:
+                    self.assertEqual(f.read(), expected)
+                with open(self.state_path, 'rb') as f:
+                    state = f.read()
+                self.assertEqual(state, compressed)
+                self.assertEqual(gzip.decompress(state), text)
+
+    def test_truncated_gzip(self):
+        compressed = gzip.compress(json.dumps(make_dump()).encode(), mtime=0)
+        for chunk_size in [3, 64, 1 << 16]:
+            with self.subTest(chunk_size=chunk_size), self.assertRaises(ValueError):
+                self.ingest(make_response(compressed[:-4]), chunk_size)
+
+    def test_trailing_data(self):
+        compressed = gzip.compress(json.dumps(make_dump()).encode() + b' {}', mtime=0)
+        with self.assertRaises(ValueError):
+            self.ingest(make_response(compressed), 64)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
 package cmd
 
 import (
+	"bufio"
 	"context"
+	"encoding/binary"
 	"fmt"
 	"os"
 	"os/exec"
@@ -80,6 +82,12 @@ var (
 		Name:  "pprof.cpu",
 		Usage: "enable pprof cpu profiling",
 	}
+	RunTracePCFlag = &cli.PathFlag{
+		Name:      "trace-pc",
+		Usage:     "path to record the PC of every executed instruction to, as big-endian uint32s. The PC of a syscall is followed by its syscall number. Not written if empty.",
+		TakesFile: true,
+		Required:  false,
+	}
 )
 
 type Proof struct {
@@ -275,6 +283,23 @@ func Run(ctx *cli.Context) error {
 		}
 	}
 
+	var traceW *bufio.Writer
+	if tracePath := ctx.Path(RunTracePCFlag.Name); tracePath != "" {
+		f, err := os.Create(tracePath)
+		if err != nil {
+			return fmt.Errorf("failed to create PC trace: %w", err)
+		}
+		traceW = bufio.NewWriterSize(f, 1<<20)
+		defer func() {
+			if err := traceW.Flush(); err != nil {
+				l.Error("failed to flush PC trace", "err", err)
+			}
+			if err := f.Close(); err != nil {
+				l.Error("failed to close PC trace", "err", err)
+			}
+		}()
+	}
+
 	us := mipsevm.NewInstrumentedState(state, po, outLog, errLog)
 	proofFmt := ctx.String(RunProofFmtFlag.Name)
 	snapshotFmt := ctx.String(RunSnapshotFmtFlag.Name)
@@ -320,6 +345,12 @@ func Run(ctx *cli.Context) error {
 			break
 		}
 
+		if traceW != nil {
+			if err := writeTracePC(traceW, state); err != nil {
+				return fmt.Errorf("failed to write PC trace: %w", err)
+			}
+		}
+
 		if snapshotAt(state) {
 			if err := writeJSON(fmt.Sprintf(snapshotFmt, step), state); err != nil {
 				return fmt.Errorf("failed to write state snapshot: %w", err)
@@ -368,6 +399,20 @@ func Run(ctx *cli.Context) error {
 	return nil
 }
 
+// writeTracePC records the PC of the instruction about to be executed, followed by the
+// syscall number in $v0 if the instruction is a syscall.
+func writeTracePC(w *bufio.Writer, state *mipsevm.State) error {
+	var buf [8]byte
+	binary.BigEndian.PutUint32(buf[:4], state.PC)
+	n := 4
+	if insn := state.Memory.GetMemory(state.PC); insn&0xfc00003f == 0x0c {
+		binary.BigEndian.PutUint32(buf[4:], state.Registers[2])
+		n = 8
+	}
+	_, err := w.Write(buf[:n])
+	return err
+}
+
 var RunCommand = &cli.Command{
 	Name:        "run",
 	Usage:       "Run VM step(s) and generate proof data to replicate onchain.",
@@ -384,5 +429,6 @@ var RunCommand = &cli.Command{
 		RunMetaFlag,
 		RunInfoAtFlag,
 		RunPProfCPU,
+		RunTracePCFlag,
 	},
 }
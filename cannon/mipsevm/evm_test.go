@@ -8,7 +8,6 @@ import (
 	"io"
 	"math/big"
 	"os"
-	"path"
 	"strings"
 	"testing"
 	"time"
@@ -139,29 +138,24 @@ func encodePreimageOracleInput(t *testing.T, wit *StepWitness, localContext Loca
 }
 
 func TestEVM(t *testing.T) {
-	testFiles, err := os.ReadDir("open_mips_tests/test/bin")
-	require.NoError(t, err)
-
 	contracts, addrs := testContractsSetup(t)
 	var tracer vm.EVMLogger // no-tracer by default, but MarkdownTracer
 
-	for _, f := range testFiles {
-		t.Run(f.Name(), func(t *testing.T) {
+	for _, test := range loadOpenMIPSTests(t) {
+		test := test
+		t.Run(test.Name, func(t *testing.T) {
 			var oracle PreimageOracle
-			if strings.HasPrefix(f.Name(), "oracle") {
+			if strings.HasPrefix(test.Name, "oracle") {
 				oracle = staticOracle(t, []byte("hello world"))
 			}
 			// Short-circuit early for exit_group.bin
-			exitGroup := f.Name() == "exit_group.bin"
+			exitGroup := test.Name == "exit_group.bin"
 
 			evm := NewMIPSEVM(contracts, addrs)
 			evm.SetTracer(tracer)
 
-			fn := path.Join("open_mips_tests/test/bin", f.Name())
-			programMem, err := os.ReadFile(fn)
-			require.NoError(t, err)
 			state := &State{PC: 0, NextPC: 4, Memory: NewMemory()}
-			err = state.Memory.SetMemoryRange(0, bytes.NewReader(programMem))
+			err := state.Memory.SetMemoryRange(0, bytes.NewReader(test.Program))
 			require.NoError(t, err, "load program into state")
 
 			// set the return address ($ra) to jump into when test completes
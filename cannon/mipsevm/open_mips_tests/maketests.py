@@ -1,37 +1,137 @@
 #!/usr/bin/env python3
+import argparse
+import hashlib
+import json
 import os
-import sys
+import subprocess
 import tempfile
-from capstone import *
+from concurrent.futures import ProcessPoolExecutor
 from elftools.elf.elffile import ELFFile
-md = Cs(CS_ARCH_MIPS, CS_MODE_32 + CS_MODE_BIG_ENDIAN)
+
+import testbundle
+
+AS = "mips-linux-gnu-as"
+# which mips is go
+AS_FLAGS = ["-defsym", "big_endian=1", "-march=mips32r2"]
+
+# Hashes of the sources and outputs of the last build, so unchanged tests are skipped.
+# Not checked in.
+CACHE_FILE = ".maketests-cache.json"
 
 def maketest(d, out):
   with tempfile.NamedTemporaryFile() as nf:
     print("building", d, "->", out)
-    # which mips is go
-    ret = os.system("mips-linux-gnu-as -defsym big_endian=1 -march=mips32r2 -o %s %s" % (nf.name, d))
-    assert(ret == 0)
+    subprocess.run([AS] + AS_FLAGS + ["-o", nf.name, d], check=True)
     nf.seek(0)
     elffile = ELFFile(nf)
-    #print(elffile)
     for sec in elffile.iter_sections():
-      #print(sec, sec.name, sec.data())
       if sec.name == ".test":
         with open(out, "wb") as f:
           # jump to 0xdead0000 when done
           #data = b"\x24\x1f\xde\xad\x00\x1f\xfc\x00" + sec.data()
           data = sec.data()
-          for dd in md.disasm(data, 0):
-            print(dd)
           f.write(data)
+        return data
+
+def disasm(path):
+  from capstone import Cs, CS_ARCH_MIPS, CS_MODE_32, CS_MODE_BIG_ENDIAN
+  md = Cs(CS_ARCH_MIPS, CS_MODE_32 + CS_MODE_BIG_ENDIAN)
+  with open(path, "rb") as f:
+    for dd in md.disasm(f.read(), 0):
+      print(dd)
+
+def assembler_version():
+  return subprocess.run([AS, "--version"], capture_output=True, check=True, text=True).stdout.splitlines()[0]
+
+def source_key(path, version):
+  h = hashlib.sha256()
+  h.update("\0".join([version] + AS_FLAGS).encode())
+  with open(path, "rb") as f:
+    h.update(f.read())
+  return h.hexdigest()
+
+def file_hash(path):
+  try:
+    with open(path, "rb") as f:
+      return hashlib.sha256(f.read()).hexdigest()
+  except FileNotFoundError:
+    return None
+
+def load_cache():
+  try:
+    with open(CACHE_FILE) as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return {}
+
+def save_cache(cache):
+  with open(CACHE_FILE + ".tmp", "w") as f:
+    json.dump(cache, f, indent=1, sort_keys=True)
+  os.replace(CACHE_FILE + ".tmp", CACHE_FILE)
+
+def maketests(jobs=None, force=False):
+  """Builds every test/*.asm whose source, assembler or output changed since the last build."""
+  version = assembler_version()
+  tests = sorted(d for d in os.listdir("test/") if d.endswith(".asm"))
+  cache = {} if force else load_cache()
+  cache = {d: entry for d, entry in cache.items() if d in tests}
+  todo = {}
+  for d in tests:
+    src, out = "test/"+d, "test/bin/"+(d.replace(".asm", ".bin"))
+    key = source_key(src, version)
+    entry = cache.get(d)
+    if entry is not None and entry["source"] == key and entry["bin"] == file_hash(out):
+      continue
+    todo[d] = (src, out, key)
+
+  print("building %d of %d tests" % (len(todo), len(tests)))
+  failed = []
+  with ProcessPoolExecutor(max_workers=jobs) as pool:
+    results = {d: pool.submit(maketest, src, out) for d, (src, out, _) in todo.items()}
+    for d, fut in results.items():
+      try:
+        fut.result()
+      except Exception as e:
+        print("failed to build", d, ":", e)
+        failed.append(d)
+        continue
+      src, out, key = todo[d]
+      cache[d] = {"source": key, "bin": file_hash(out)}
+  # Saved even if some tests failed, so the next run only retries those.
+  save_cache(cache)
+  if failed:
+    raise SystemExit("failed to build: " + ", ".join(failed))
+  return [out for _, out, _ in todo.values()]
 
 if __name__ == "__main__":
-  os.makedirs("/tmp/mips", exist_ok=True)
-  if len(sys.argv) > 2:
-    maketest(sys.argv[1], sys.argv[2])
+  parser = argparse.ArgumentParser(description="Assembles the OpenMIPS test vectors")
+  parser.add_argument("asm", nargs="?", help="Single test to build, instead of all of test/")
+  parser.add_argument("out", nargs="?", help="Output of the single test")
+  parser.add_argument("--jobs", type=int, help="Number of tests to build at once, defaults to the CPU count")
+  parser.add_argument("--force", action="store_true", help="Rebuild every test, ignoring the cache")
+  parser.add_argument("--disasm", action="store_true", help="Print the disassembly of the built tests")
+  parser.add_argument("--bundle", action="store_true",
+                      help="Also pack the tests into %s, read by the mipsevm tests when present. An existing bundle is always updated" % testbundle.BUNDLE_FILE)
+  parser.add_argument("--check-bundle", action="store_true",
+                      help="Fail if %s does not match the tests in %s, without building" % (testbundle.BUNDLE_FILE, testbundle.BIN_DIR))
+  args = parser.parse_args()
+
+  if args.check_bundle:
+    if testbundle.is_stale():
+      raise SystemExit("%s is stale, run maketests.py --bundle" % testbundle.BUNDLE_FILE)
+    raise SystemExit(0)
+
+  if args.asm:
+    if not args.out:
+      parser.error("out is required with asm")
+    maketest(args.asm, args.out)
+    built = [args.out]
   else:
-    for d in os.listdir("test/"):
-      if not d.endswith(".asm"):
-        continue
-      maketest("test/"+d, "test/bin/"+(d.replace(".asm", ".bin")))
+    built = maketests(args.jobs, args.force)
+  if args.disasm:
+    for out in built:
+      print(out)
+      disasm(out)
+  # An existing bundle is always refreshed, the mipsevm tests would otherwise run its stale programs.
+  if (args.bundle or os.path.exists(testbundle.BUNDLE_FILE)) and testbundle.write_bundle():
+    print("wrote", testbundle.BUNDLE_FILE)
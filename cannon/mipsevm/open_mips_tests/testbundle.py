@@ -0,0 +1,110 @@
+"""
+Packs the test programs of test/bin into a single file, so a test run opens one file
+and slices each program out of it instead of reading dozens of small files.
+
+Layout, all integers little-endian:
+
+  header  magic "MIPSTV01", u32 entry count, u32 zero
+  index   per entry: name (32 bytes, NUL padded), u64 offset, u64 length, sha256
+  data    the programs, in index order, each starting at a multiple of 8
+
+Entries are sorted by name and all padding is zero, so the same programs always give
+the same bytes, and a bundle is stale exactly when it differs from a fresh pack.
+"""
+import hashlib
+import mmap
+import os
+import struct
+
+MAGIC = b"MIPSTV01"
+HEADER = struct.Struct("<8sII")
+ENTRY = struct.Struct("<32sQQ32s")
+ALIGN = 8
+
+BIN_DIR = "test/bin"
+BUNDLE_FILE = "test/tests.bundle"
+
+def pack(programs):
+  """Returns the bundle of `programs`, a dict of name to program bytes."""
+  names = sorted(programs)
+  offset = HEADER.size + ENTRY.size * len(names)
+  index = []
+  data = []
+  for name in names:
+    encoded = name.encode()
+    if len(encoded) > 32:
+      raise ValueError("test name too long for the bundle index: " + name)
+    program = programs[name]
+    pad = -offset % ALIGN
+    data.append(b"\0" * pad)
+    offset += pad
+    index.append(ENTRY.pack(encoded, offset, len(program), hashlib.sha256(program).digest()))
+    data.append(program)
+    offset += len(program)
+  return HEADER.pack(MAGIC, len(names), 0) + b"".join(index) + b"".join(data)
+
+def read_programs(bin_dir=BIN_DIR):
+  programs = {}
+  for name in os.listdir(bin_dir):
+    if name.endswith(".bin"):
+      with open(os.path.join(bin_dir, name), "rb") as f:
+        programs[name] = f.read()
+  return programs
+
+def is_stale(bin_dir=BIN_DIR, path=BUNDLE_FILE):
+  expected = pack(read_programs(bin_dir))
+  try:
+    with open(path, "rb") as f:
+      return f.read() != expected
+  except FileNotFoundError:
+    return True
+
+def write_bundle(bin_dir=BIN_DIR, path=BUNDLE_FILE):
+  """Writes the bundle of the programs in `bin_dir`, unless it is up to date. Returns whether it was written."""
+  data = pack(read_programs(bin_dir))
+  try:
+    with open(path, "rb") as f:
+      if f.read() == data:
+        return False
+  except FileNotFoundError:
+    pass
+  with open(path + ".tmp", "wb") as f:
+    f.write(data)
+  os.replace(path + ".tmp", path)
+  return True
+
+class TestBundle:
+  """Read-only view of a bundle. Programs are slices of the memory-mapped file, not copies."""
+
+  def __init__(self, path=BUNDLE_FILE):
+    with open(path, "rb") as f:
+      self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    self._view = memoryview(self._mm)
+    magic, count, _ = HEADER.unpack_from(self._mm, 0)
+    if magic != MAGIC:
+      raise ValueError("not a test bundle: " + path)
+    self.index = {}
+    for i in range(count):
+      name, offset, length, digest = ENTRY.unpack_from(self._mm, HEADER.size + i * ENTRY.size)
+      self.index[name.rstrip(b"\0").decode()] = (offset, length, digest)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def close(self):
+    self._view.release()
+    self._mm.close()
+
+  def names(self):
+    return list(self.index)
+
+  def __getitem__(self, name):
+    offset, length, _ = self.index[name]
+    return self._view[offset:offset + length]
+
+  def verify(self):
+    """Returns the names of the programs whose content does not match their hash."""
+    return [name for name, (_, _, digest) in self.index.items() if hashlib.sha256(self[name]).digest() != digest]
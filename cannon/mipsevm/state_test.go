@@ -8,7 +8,6 @@ import (
 	"fmt"
 	"io"
 	"os"
-	"path"
 	"strings"
 	"testing"
 
@@ -26,29 +25,24 @@ const baseAddrEnd = 0xbf_ff_ff_f0
 const endAddr = 0xa7ef00d0
 
 func TestState(t *testing.T) {
-	testFiles, err := os.ReadDir("open_mips_tests/test/bin")
-	require.NoError(t, err)
-
-	for _, f := range testFiles {
-		t.Run(f.Name(), func(t *testing.T) {
+	for _, test := range loadOpenMIPSTests(t) {
+		test := test
+		t.Run(test.Name, func(t *testing.T) {
 			var oracle PreimageOracle
-			if strings.HasPrefix(f.Name(), "oracle") {
+			if strings.HasPrefix(test.Name, "oracle") {
 				oracle = staticOracle(t, []byte("hello world"))
 			}
 			// Short-circuit early for exit_group.bin
-			exitGroup := f.Name() == "exit_group.bin"
+			exitGroup := test.Name == "exit_group.bin"
 
 			// TODO: currently tests are compiled as flat binary objects
 			// We can use more standard tooling to compile them to ELF files and get remove maketests.py
-			fn := path.Join("open_mips_tests/test/bin", f.Name())
 			//elfProgram, err := elf.Open()
 			//require.NoError(t, err, "must load test ELF binary")
 			//state, err := LoadELF(elfProgram)
 			//require.NoError(t, err, "must load ELF into state")
-			programMem, err := os.ReadFile(fn)
-			require.NoError(t, err)
 			state := &State{PC: 0, NextPC: 4, Memory: NewMemory()}
-			err = state.Memory.SetMemoryRange(0, bytes.NewReader(programMem))
+			err := state.Memory.SetMemoryRange(0, bytes.NewReader(test.Program))
 			require.NoError(t, err, "load program into state")
 
 			// set the return address ($ra) to jump into when test completes
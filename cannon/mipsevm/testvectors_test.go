@@ -0,0 +1,83 @@
+package mipsevm
+
+import (
+	"bytes"
+	"crypto/sha256"
+	"encoding/binary"
+	"errors"
+	"fmt"
+	"io/fs"
+	"os"
+	"path"
+	"testing"
+
+	"github.com/stretchr/testify/require"
+)
+
+const (
+	openMIPSTestsDir   = "open_mips_tests/test/bin"
+	openMIPSTestBundle = "open_mips_tests/test/tests.bundle"
+
+	// Layout of the bundle written by open_mips_tests/testbundle.py.
+	bundleMagic      = "MIPSTV01"
+	bundleHeaderSize = 16
+	bundleEntrySize  = 32 + 8 + 8 + 32
+)
+
+type openMIPSTest struct {
+	Name    string
+	Program []byte
+}
+
+// loadOpenMIPSTests returns the OpenMIPS test programs, sorted by name. They are sliced out
+// of the bundle written by `maketests.py --bundle` if there is one, and read from the
+// individual test binaries otherwise.
+func loadOpenMIPSTests(t *testing.T) []openMIPSTest {
+	data, err := os.ReadFile(openMIPSTestBundle)
+	if errors.Is(err, fs.ErrNotExist) {
+		return readOpenMIPSTests(t)
+	}
+	require.NoError(t, err)
+	tests, err := parseTestBundle(data)
+	require.NoError(t, err, "invalid test bundle, regenerate it with maketests.py --bundle")
+	return tests
+}
+
+func readOpenMIPSTests(t *testing.T) []openMIPSTest {
+	testFiles, err := os.ReadDir(openMIPSTestsDir)
+	require.NoError(t, err)
+	var tests []openMIPSTest
+	for _, f := range testFiles {
+		programMem, err := os.ReadFile(path.Join(openMIPSTestsDir, f.Name()))
+		require.NoError(t, err)
+		tests = append(tests, openMIPSTest{Name: f.Name(), Program: programMem})
+	}
+	return tests
+}
+
+// parseTestBundle returns the programs of a test bundle. The programs share the memory of data.
+func parseTestBundle(data []byte) ([]openMIPSTest, error) {
+	if len(data) < bundleHeaderSize || string(data[:8]) != bundleMagic {
+		return nil, errors.New("bad magic")
+	}
+	count := int(binary.LittleEndian.Uint32(data[8:12]))
+	if len(data) < bundleHeaderSize+count*bundleEntrySize {
+		return nil, errors.New("truncated index")
+	}
+	tests := make([]openMIPSTest, 0, count)
+	for i := 0; i < count; i++ {
+		entry := data[bundleHeaderSize+i*bundleEntrySize:][:bundleEntrySize]
+		name := string(bytes.TrimRight(entry[:32], "\x00"))
+		offset := binary.LittleEndian.Uint64(entry[32:40])
+		length := binary.LittleEndian.Uint64(entry[40:48])
+		if offset > uint64(len(data)) || length > uint64(len(data))-offset {
+			return nil, fmt.Errorf("program %s out of bounds", name)
+		}
+		program := data[offset : offset+length]
+		if sum := sha256.Sum256(program); !bytes.Equal(sum[:], entry[48:80]) {
+			return nil, fmt.Errorf("program %s does not match its hash", name)
+		}
+		tests = append(tests, openMIPSTest{Name: name, Program: program})
+	}
+	return tests, nil
+}
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Instruction mix profile of a MIPS program run by cannon, such as the op-program client.
+
+    python3 scripts/insn_profile.py --elf ../op-program/bin/op-program-client.elf
+    ./bin/cannon run --trace-pc trace.bin ... -- <pre-image server>
+    python3 scripts/insn_profile.py --elf ../op-program/bin/op-program-client.elf --trace trace.bin
+
+The ELF gives the static instruction mix and the syscall sites. A trace recorded with
+`cannon run --trace-pc` adds the dynamic instruction mix, the hottest basic blocks and
+the syscall frequencies. The trace is read in fixed-size chunks and aggregated per basic
+block, so memory does not grow with its length.
+
+Requires the `capstone` and `pyelftools` packages, like open_mips_tests/maketests.py.
+"""
+import argparse
+import bisect
+import json
+import sys
+from array import array
+from collections import Counter
+
+from capstone import Cs, CS_ARCH_MIPS, CS_MODE_32, CS_MODE_BIG_ENDIAN
+from elftools.elf.constants import SH_FLAGS
+from elftools.elf.elffile import ELFFile
+
+# Syscalls handled by mipsevm, see mipsevm/mips.go. Others are no-ops there.
+SYSCALL_NAMES = {
+    4003: 'read',
+    4004: 'write',
+    4045: 'brk',
+    4055: 'fcntl',
+    4090: 'mmap',
+    4120: 'clone',
+    4246: 'exit_group',
+}
+
+CHUNK_SIZE = 1 << 20
+# Mnemonic id of words that are not code, or that capstone cannot decode.
+NOT_CODE = 0
+
+
+class Program:
+    """
+    The decoded code of a MIPS ELF. Each instruction is stored as a mnemonic id in a
+    flat array indexed by (pc - base) / 4, so lookups are cheap and memory is two
+    bytes per instruction.
+    """
+
+    def __init__(self, path):
+        md = Cs(CS_ARCH_MIPS, CS_MODE_32 + CS_MODE_BIG_ENDIAN)
+        md.skipdata = True
+        self.mnemonics = ['(data)']
+        ids = {}
+        with open(path, 'rb') as f:
+            elf = ELFFile(f)
+            sections = [s for s in elf.iter_sections() if s['sh_flags'] & SH_FLAGS.SHF_EXECINSTR and s['sh_size']]
+            if not sections:
+                raise ValueError(f'{path} has no code')
+            self.base = min(s['sh_addr'] for s in sections)
+            end = max(s['sh_addr'] + s['sh_size'] for s in sections)
+            self.ids = array('H', bytes(2 * ((end - self.base + 3) // 4)))
+            # pc of each syscall -> its syscall number, if set by an immediate load
+            # into $v0 in the same block.
+            self.syscalls = {}
+            for sec in sections:
+                v0 = None
+                for addr, _, mnemonic, op_str in md.disasm_lite(sec.data(), sec['sh_addr']):
+                    if mnemonic == '.byte':
+                        v0 = None
+                        continue
+                    mid = ids.get(mnemonic)
+                    if mid is None:
+                        mid = ids[mnemonic] = len(self.mnemonics)
+                        self.mnemonics.append(mnemonic)
+                    self.ids[(addr - self.base) >> 2] = mid
+                    if mnemonic == 'syscall':
+                        self.syscalls[addr] = v0
+                    v0 = _v0_immediate(mnemonic, op_str, v0)
+            self.symbols = _symbols(elf)
+        self.symbol_starts = [start for start, _ in self.symbols]
+
+    def mnemonic_at(self, pc):
+        i = (pc - self.base) >> 2
+        return self.mnemonics[self.ids[i]] if 0 <= i < len(self.ids) else '(outside code)'
+
+    def symbol_at(self, pc):
+        i = bisect.bisect_right(self.symbol_starts, pc) - 1
+        return self.symbols[i][1] if i >= 0 else '!unknown'
+
+    def static_mix(self):
+        counts = Counter(self.ids)
+        counts.pop(NOT_CODE, None)
+        return Counter({self.mnemonics[mid]: n for mid, n in counts.items()})
+
+
+class TraceProfile:
+    """
+    Aggregates a PC trace by dynamic basic block: a run of consecutive PCs, ended by
+    any control transfer. Each block is counted once per execution, and the mix is
+    derived from the blocks at the end.
+    """
+
+    def __init__(self, program):
+        self.program = program
+        # (start pc, number of instructions) -> executions
+        self.blocks = Counter()
+        self.syscalls = Counter()
+        self.steps = 0
+
+    def read(self, f):
+        syscall_pcs = set(self.program.syscalls)
+        blocks = self.blocks
+        syscalls = self.syscalls
+        start, length, expect = None, 0, None
+        want_v0 = False
+        swap = sys.byteorder == 'little'
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if len(chunk) % 4:
+                rest = f.read(4 - len(chunk) % 4)
+                if len(chunk + rest) % 4:
+                    raise ValueError('Trace is truncated')
+                chunk += rest
+            words = array('I')
+            words.frombytes(chunk)
+            if swap:
+                words.byteswap()
+            i = 0
+            n = len(words)
+            if want_v0:
+                syscalls[words[0]] += 1
+                i = 1
+                want_v0 = False
+            while i < n:
+                pc = words[i]
+                i += 1
+                if pc != expect:
+                    if start is not None:
+                        blocks[(start, length)] += 1
+                    start, length = pc, 0
+                length += 1
+                expect = pc + 4
+                self.steps += 1
+                if pc in syscall_pcs:
+                    if i < n:
+                        syscalls[words[i]] += 1
+                        i += 1
+                    else:
+                        want_v0 = True
+        if start is not None:
+            blocks[(start, length)] += 1
+
+    def dynamic_mix(self):
+        program = self.program
+        counts = Counter()
+        for (start, length), execs in self.blocks.items():
+            for k in range(length):
+                counts[program.mnemonic_at(start + 4 * k)] += execs
+        return counts
+
+    def hot_blocks(self, top):
+        """Returns the `top` blocks that executed the most instructions, merging different block lengths."""
+        per_start = Counter()
+        execs = Counter()
+        for (start, length), n in self.blocks.items():
+            per_start[start] += n * length
+            execs[start] += n
+        return [(start, steps, execs[start]) for start, steps in per_start.most_common(top)]
+
+
+def _v0_immediate(mnemonic, op_str, v0):
+    """Tracks the value loaded into $v0 by an immediate, the usual setup of a Go syscall."""
+    ops = [o.strip() for o in op_str.split(',')]
+    if mnemonic.startswith(('b', 'j')):
+        return None
+    if not ops or ops[0] != '$v0':
+        return v0
+    try:
+        if mnemonic == 'li' and len(ops) == 2:
+            return int(ops[1], 0)
+        if mnemonic in ('addiu', 'ori') and len(ops) == 3 and ops[1] == '$zero':
+            return int(ops[2], 0)
+    except ValueError:
+        pass
+    return None
+
+
+def _symbols(elf):
+    symtab = elf.get_section_by_name('.symtab')
+    if symtab is None:
+        return []
+    return sorted((s['st_value'], s.name) for s in symtab.iter_symbols() if s['st_info']['type'] == 'STT_FUNC')
+
+
+def syscall_name(num):
+    if num is None:
+        return '(unknown)'
+    return f'{SYSCALL_NAMES.get(num, "?")} ({num})'
+
+
+def print_table(title, rows, total):
+    print(f'\n{title}')
+    for label, n in rows:
+        print(f'  {n:>14,}  {100 * n / total if total else 0:6.2f}%  {label}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Instruction mix profile of a MIPS program')
+    parser.add_argument('--elf', required=True, help='MIPS ELF that was run, e.g. the op-program client')
+    parser.add_argument('--trace', help='PC trace recorded with `cannon run --trace-pc`, - for stdin')
+    parser.add_argument('--top', type=int, default=25, help='Number of rows per table')
+    parser.add_argument('--json', action='store_true', help='Print the profile as JSON')
+    args = parser.parse_args()
+
+    program = Program(args.elf)
+    static = program.static_mix()
+    static_syscalls = Counter(program.syscalls.values())
+    profile = {
+        'static_mix': dict(static.most_common()),
+        'static_syscalls': {syscall_name(k): v for k, v in static_syscalls.most_common()},
+    }
+
+    trace = None
+    if args.trace:
+        trace = TraceProfile(program)
+        if args.trace == '-':
+            trace.read(sys.stdin.buffer)
+        else:
+            with open(args.trace, 'rb') as f:
+                trace.read(f)
+        profile['steps'] = trace.steps
+        profile['dynamic_mix'] = dict(trace.dynamic_mix().most_common())
+        profile['hot_blocks'] = [
+            {'pc': f'0x{start:08x}', 'symbol': program.symbol_at(start), 'steps': steps, 'executions': execs}
+            for start, steps, execs in trace.hot_blocks(args.top)
+        ]
+        profile['syscalls'] = {syscall_name(k): v for k, v in trace.syscalls.most_common()}
+
+    if args.json:
+        json.dump(profile, sys.stdout, indent=2)
+        print()
+        return
+
+    print_table('Static instruction mix', static.most_common(args.top), sum(static.values()))
+    print_table('Syscall sites', [(syscall_name(k), v) for k, v in static_syscalls.most_common(args.top)],
+                len(program.syscalls))
+    if trace is not None:
+        dynamic = Counter(profile['dynamic_mix'])
+        print(f'\n{trace.steps:,} steps traced')
+        print_table('Dynamic instruction mix', dynamic.most_common(args.top), trace.steps)
+        print_table('Hottest basic blocks',
+                    [(f'0x{b["pc"][2:]} {b["symbol"]} ({b["executions"]:,} runs)', b['steps']) for b in profile['hot_blocks']],
+                    trace.steps)
+        print_table('Syscalls', list(profile['syscalls'].items()), sum(trace.syscalls.values()))
+
+
+if __name__ == '__main__':
+    main()
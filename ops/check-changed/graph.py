@@ -0,0 +1,260 @@
+import glob
+import json
+import logging
+import os
+import re
+import subprocess
+
+log = logging.getLogger(__name__)
+
+SKIP_DIRS = {'.git', 'node_modules', 'testdata', 'vendor'}
+
+IMPORT_BLOCK_RE = re.compile(r'^import\s*\(([^)]*)\)', re.MULTILINE)
+IMPORT_LINE_RE = re.compile(r'^import\s+(?:[\w.]+\s+)?"([^"]+)"', re.MULTILINE)
+QUOTED_RE = re.compile(r'"([^"]+)"')
+MODULE_RE = re.compile(r'^module\s+(\S+)', re.MULTILINE)
+WORKSPACE_GLOB_RE = re.compile(r'^\s*-\s*[\'"]?([^\'"\s]+)[\'"]?\s*$')
+
+
+class ProjectGraph:
+    """
+    Projects of the monorepo and the dependencies between them.
+
+    A project is a directory: a top-level directory with Go packages of the root
+    module, a directory with its own go.mod, or a pnpm workspace package. Project A
+    depends on project B if a Go package in A imports one in B, or if A's
+    package.json depends on B's package.
+    """
+
+    def __init__(self, root_module, projects, deps, go_imports, go_modules):
+        self.root_module = root_module
+        # Longest first, so nested projects win over their parents.
+        self.projects = sorted(projects, key=len, reverse=True)
+        self.deps = deps
+        # Imports and module path of each Go project, None for the others.
+        self.go_imports = go_imports
+        self.go_modules = go_modules
+        self.rdeps = {p: set() for p in projects}
+        for project, targets in deps.items():
+            for target in targets:
+                self.rdeps[target].add(project)
+
+    def project_of(self, path):
+        for project in self.projects:
+            if path == project or path.startswith(project + '/'):
+                return project
+        return None
+
+    def root_go_projects(self):
+        return {p for p, module in self.go_modules.items() if module == self.root_module}
+
+    def importers_of_modules(self, modules):
+        """Returns the root module Go projects that import a package of any of `modules`."""
+        return {
+            p for p in self.root_go_projects()
+            if any(imp == m or imp.startswith(m + '/') for imp in self.go_imports[p] for m in modules)
+        }
+
+    def affected(self, projects):
+        """Returns `projects` plus every project that depends on them, transitively."""
+        affected = set(projects)
+        queue = list(projects)
+        while queue:
+            for dependent in self.rdeps.get(queue.pop(), ()):
+                if dependent not in affected:
+                    affected.add(dependent)
+                    queue.append(dependent)
+        return affected
+
+
+def build_graph(monorepo_path):
+    root_module = read_module(os.path.join(monorepo_path, 'go.mod'))
+    modules = {'': root_module}
+    packages = workspace_packages(monorepo_path)
+    package_dirs = set(packages.values())
+    go_imports = {}
+    for dirpath, dirnames, filenames in os.walk(monorepo_path):
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and not d.startswith('.')]
+        rel = os.path.relpath(dirpath, monorepo_path).replace(os.sep, '/')
+        rel = '' if rel == '.' else rel
+        if rel and 'go.mod' in filenames:
+            modules[rel] = read_module(os.path.join(dirpath, 'go.mod'))
+        go_files = [f for f in filenames if f.endswith('.go')]
+        if not rel or not go_files:
+            continue
+        project = _go_project(rel, modules, package_dirs)
+        imports = go_imports.setdefault(project, set())
+        for name in go_files:
+            with open(os.path.join(dirpath, name), encoding='utf-8', errors='replace') as f:
+                imports.update(parse_go_imports(f.read()))
+
+    projects = set(go_imports) | package_dirs
+    deps = {p: set() for p in projects}
+    graph_modules = {}
+    for project, imports in go_imports.items():
+        module_dir = _module_dir(project, modules)
+        module = modules[module_dir]
+        graph_modules[project] = module
+        for imp in imports:
+            if imp == module or imp.startswith(module + '/'):
+                target_path = os.path.join(module_dir, imp[len(module) + 1:]).replace(os.sep, '/')
+                target = _go_project(target_path, modules, package_dirs)
+                if target in projects and target != project:
+                    deps[project].add(target)
+
+    for pkg_dir, (name, pkg_deps) in _package_manifests(monorepo_path, packages).items():
+        for dep in pkg_deps:
+            if dep in packages and packages[dep] != pkg_dir:
+                deps[pkg_dir].add(packages[dep])
+
+    return ProjectGraph(root_module, projects, deps, {p: go_imports.get(p) for p in projects},
+                        {p: graph_modules.get(p) for p in projects})
+
+
+def affected_projects(graph, monorepo_path, paths, base, head):
+    """
+    Returns the projects affected by changes to `paths` between the `base` and `head`
+    revisions: the projects containing them and every project depending on those.
+
+    A change to the root go.mod only affects the Go projects importing a module whose
+    requirement changed. Changes to indirect requirements, the go directive or
+    go.sum alone affect every Go project of the root module, since which packages
+    use them cannot be told from imports.
+    """
+    touched = {graph.project_of(p) for p in paths if p not in ('go.mod', 'go.sum')} - {None}
+    if 'go.mod' in paths:
+        changed = changed_go_requirements(git_show(monorepo_path, base, 'go.mod'), git_show(monorepo_path, head, 'go.mod'))
+        if changed is None:
+            log.info('go.mod go directive changed, all Go projects are affected')
+            touched |= graph.root_go_projects()
+        else:
+            direct, indirect = changed
+            log.info('go.mod requirements changed: %s', ', '.join(sorted(direct | indirect)) or 'none')
+            touched |= graph.root_go_projects() if indirect else graph.importers_of_modules(direct)
+    elif 'go.sum' in paths:
+        touched |= graph.root_go_projects()
+    return graph.affected(touched)
+
+
+def parse_go_imports(source):
+    imports = set(IMPORT_LINE_RE.findall(source))
+    for block in IMPORT_BLOCK_RE.findall(source):
+        imports.update(QUOTED_RE.findall(block))
+    return imports
+
+
+def read_module(go_mod_path):
+    with open(go_mod_path) as f:
+        match = MODULE_RE.search(f.read())
+    return match.group(1) if match else None
+
+
+def workspace_packages(monorepo_path):
+    """Returns {package name: package dir} for the pnpm workspace packages."""
+    packages = {}
+    for pattern in _workspace_globs(monorepo_path):
+        for manifest in glob.glob(os.path.join(monorepo_path, pattern, 'package.json')):
+            with open(manifest) as f:
+                name = json.load(f).get('name')
+            if name:
+                rel = os.path.relpath(os.path.dirname(manifest), monorepo_path).replace(os.sep, '/')
+                packages[name] = rel
+    return packages
+
+
+def parse_go_mod(source):
+    """
+    Returns the requirements of a go.mod as {module: version}, with replaced modules
+    mapped to their replacement, and the go and toolchain directives under the keys
+    'go' and 'toolchain'. Also returns the set of indirect requirements.
+    """
+    requires = {}
+    replaces = {}
+    indirect = set()
+    block = None
+    for line in source.splitlines():
+        line, _, comment = line.partition('//')
+        line = line.strip()
+        if not line:
+            continue
+        if line == ')':
+            block = None
+            continue
+        words = line.split()
+        if block is None and len(words) == 2 and words[1] == '(':
+            block = words[0]
+            continue
+        if block is None:
+            directive, words = words[0], words[1:]
+        else:
+            directive = block
+        if directive in ('go', 'toolchain') and words:
+            requires[directive] = words[0]
+        elif directive == 'require' and len(words) >= 2:
+            requires[words[0]] = words[1]
+            if comment.strip() == 'indirect':
+                indirect.add(words[0])
+        elif directive == 'replace' and '=>' in words:
+            arrow = words.index('=>')
+            replaces[words[0]] = ' '.join(words[arrow + 1:])
+    for module, replacement in replaces.items():
+        requires[module] = f'{requires.get(module)} => {replacement}'
+    return requires, indirect
+
+
+def changed_go_requirements(old_source, new_source):
+    """
+    Returns the (direct, indirect) modules whose requirement changed between two
+    versions of a go.mod, or None if the go or toolchain directive changed.
+    """
+    (old, old_indirect), (new, new_indirect) = parse_go_mod(old_source), parse_go_mod(new_source)
+    changed = {m for m in old.keys() | new.keys() if old.get(m) != new.get(m)}
+    if changed & {'go', 'toolchain'}:
+        return None
+    indirect = {m for m in changed if m in old_indirect or m in new_indirect}
+    return changed - indirect, indirect
+
+
+def git_show(monorepo_path, rev, path):
+    result = subprocess.run(['git', 'show', f'{rev}:{path}'], cwd=monorepo_path, capture_output=True, text=True)
+    return result.stdout if result.returncode == 0 else ''
+
+
+def _workspace_globs(monorepo_path):
+    globs = []
+    with open(os.path.join(monorepo_path, 'pnpm-workspace.yaml')) as f:
+        for line in f:
+            match = WORKSPACE_GLOB_RE.match(line)
+            if match:
+                globs.append(match.group(1))
+    return globs
+
+
+def _package_manifests(monorepo_path, packages):
+    manifests = {}
+    for name, pkg_dir in packages.items():
+        with open(os.path.join(monorepo_path, pkg_dir, 'package.json')) as f:
+            data = json.load(f)
+        deps = set()
+        for field in ('dependencies', 'devDependencies', 'peerDependencies', 'optionalDependencies'):
+            deps.update(data.get(field, {}))
+        manifests[pkg_dir] = (name, deps)
+    return manifests
+
+
+def _module_dir(path, modules):
+    return _longest_prefix(path, modules)
+
+
+def _go_project(path, modules, package_dirs):
+    # Go packages belong to the innermost nested module or workspace package around
+    # them, and otherwise to their top-level dir.
+    return _longest_prefix(path, modules.keys() | package_dirs) or path.split('/')[0]
+
+
+def _longest_prefix(path, dirs):
+    best = ''
+    for d in dirs:
+        if d and (path == d or path.startswith(d + '/')) and len(d) > len(best):
+            best = d
+    return best
@@ -1,20 +1,21 @@
+import argparse
 import logging.config
 import os
 import re
 import subprocess
 import sys
 import json
+import time
 
-from github import Github
+from graph import affected_projects, build_graph
 
+# The root go.mod and go.sum are not listed here: affected_projects narrows them
+# down to the Go projects whose requirements changed.
 REBUILD_ALL_PATTERNS = [
     r'^\.circleci/\.*',
     r'^\.github/\.*',
     r'^package\.json',
     r'ops/check-changed/.*',
-    r'^go\.mod',
-    r'^go\.sum',
-    r'ops/check-changed/.*'
 ]
 with open("../../nx.json") as file:
     nx_json_data = json.load(file)
@@ -54,12 +55,21 @@ logging.config.dictConfig(LOGGING_CONFIG)
 log = logging.getLogger(__name__)
 
 
+parser = argparse.ArgumentParser(description='Halts the CI job unless a changed path matches one of the patterns')
+parser.add_argument('patterns', help='Comma-separated regexes of the paths the job depends on')
+parser.add_argument('--github', action='store_true',
+                    help='Ask the GitHub API for the PR base and head instead of resolving them with git')
+parser.add_argument('--base-branch', default=os.getenv('CHECK_CHANGED_BASE_BRANCH') or os.getenv('GITHUB_BASE_REF') or nx_json_data.get('defaultBase', 'develop'),
+                    help='Branch the PR targets, used to find the merge base without the GitHub API')
+
+
 def main():
-    patterns = sys.argv[1].split(',')
+    args = parser.parse_args()
+    patterns = args.patterns.split(',')
     patterns = patterns + REBUILD_ALL_PATTERNS
 
     fp = os.path.realpath(__file__)
-    monorepo_path = os.path.realpath(os.path.join(fp, '..', '..'))
+    monorepo_path = os.path.realpath(os.path.join(fp, '..', '..', '..'))
 
     log.info('Discovered monorepo path: %s', monorepo_path)
     current_branch = git_cmd('rev-parse --abbrev-ref HEAD', monorepo_path)
@@ -71,7 +81,7 @@ def main():
 
     pr_urls = os.getenv('CIRCLE_PULL_REQUESTS', None)
     pr_urls = pr_urls.split(',') if pr_urls else []
-    if len(pr_urls) == 0:
+    if len(pr_urls) == 0 and not os.getenv('GITHUB_BASE_REF'):
         log.info('Not a PR build, triggering build')
         exit_build()
     if len(pr_urls) > 1:
@@ -79,9 +89,53 @@ def main():
         for url in pr_urls:
             log.warning(url)
 
+    shas = None if args.github else local_shas(args.base_branch, monorepo_path)
+    if shas is None:
+        shas = github_shas(pr_urls, monorepo_path)
+    merge_base, head_sha = shas
+
+    start = time.monotonic()
+    diffs = [d for d in git_cmd('diff --name-only {}...{}'.format(merge_base, head_sha), monorepo_path).split('\n') if d]
+    log.info('Found %d changed paths. Checking for matches...', len(diffs))
+
+    # A job also runs if a project it names depends on a changed project, for
+    # example an op-node job when only op-service changed.
+    affected = affected_projects(build_graph(monorepo_path), monorepo_path, diffs, merge_base, head_sha)
+    log.info('Affected projects: %s', ', '.join(sorted(affected)) or 'none')
+    paths = diffs + [project + '/' for project in sorted(affected)]
+    match = match_paths(paths, patterns)
+    log.info('Checked %d paths against %d patterns in %.0fms', len(paths), len(patterns), (time.monotonic() - start) * 1000)
+    if match is not None:
+        log.info('✅ match found on %s: %s', *match)
+        log.info('Match found, triggering build')
+        exit_build()
+
+    log.info('No matches found, skipping build')
+    exit_nobuild()
+
+
+def local_shas(base_branch, monorepo_path):
+    """
+    Returns the merge base of HEAD with the branch the PR targets, and HEAD, using
+    only the local clone. Returns None if the target branch is not in the clone.
+    """
+    for ref in ('origin/' + base_branch, base_branch):
+        if git_ok('rev-parse --verify --quiet {}^{{commit}}'.format(ref), monorepo_path):
+            merge_base = git_cmd('merge-base {} HEAD'.format(ref), monorepo_path)
+            head_sha = git_cmd('rev-parse HEAD', monorepo_path)
+            log.info('Resolved merge base %s of HEAD %s with %s', merge_base, head_sha, ref)
+            return merge_base, head_sha
+    log.warning('Base branch %s not found in the local clone, asking GitHub', base_branch)
+    return None
+
+
+def github_shas(pr_urls, monorepo_path):
+    """Returns the merge base and head of the PR, as reported by the GitHub API."""
+    from github import Github
+
     gh_token = os.getenv('GITHUB_ACCESS_TOKEN')
-    if gh_token is None:
-        log.info('No GitHub access token found - likely a fork. Triggering build')
+    if gh_token is None or not pr_urls:
+        log.info('No GitHub access token or PR URL found - likely a fork. Triggering build')
         exit_build()
 
     g = Github(gh_token)
@@ -95,32 +149,48 @@ def main():
     pr = repo.get_pull(int(pr_urls[0].split('/')[-1]))
     log.info('Found PR: %s', pr.url)
 
-    base_sha = pr.base.sha
-    head_sha = pr.head.sha
-
-    diffs = git_cmd('diff --name-only {}...{}'.format(base_sha, head_sha), monorepo_path).split('\n')
-    log.info('Found diff. Checking for matches...')
-    for diff in diffs:
-        if match_path(diff, patterns):
-            log.info('Match found, triggering build')
-            exit_build()
-        else:
-            log.info('❌ no match found on %s', diff)
-
-    log.info('No matches found, skipping build')
-    exit_nobuild()
+    return git_cmd('merge-base {} {}'.format(pr.base.sha, pr.head.sha), monorepo_path), pr.head.sha
 
 
 def git_cmd(cmd, cwd):
     return subprocess.check_output(['git'] + cmd.split(' '), cwd=cwd).decode('utf-8').strip()
 
 
-def match_path(path, patterns):
-    for pattern in patterns:
-        if re.search(pattern, path):
-            log.info('✅ match found on %s: %s', path, pattern)
-            return True
-    return False
+def git_ok(cmd, cwd):
+    return subprocess.run(['git'] + cmd.split(' '), cwd=cwd, capture_output=True).returncode == 0
+
+
+def compile_patterns(patterns):
+    """
+    Compiles the patterns into a list of (regex, patterns matched by it). Plain patterns
+    are merged into a single regex, one named group per pattern, so each path is matched
+    against all of them in one search. Patterns with their own groups or global inline
+    flags mean something else once merged, so they are matched on their own.
+    """
+    compiled = [re.compile(p) for p in patterns]
+    default_flags = re.compile('').flags
+    plain = [p for p, c in zip(patterns, compiled) if c.groups == 0 and c.flags == default_flags]
+    matchers = [(c, [p]) for p, c in zip(patterns, compiled) if p not in plain]
+    if len(plain) > 1:
+        try:
+            matchers.insert(0, (re.compile('|'.join('(?P<p{}>{})'.format(i, p) for i, p in enumerate(plain))), plain))
+        except re.error:
+            log.warning('Could not merge the patterns, matching them one by one')
+            return [(c, [p]) for p, c in zip(patterns, compiled)]
+    elif plain:
+        matchers.insert(0, (re.compile(plain[0]), plain))
+    return matchers
+
+
+def match_paths(paths, patterns):
+    """Returns the first (path, pattern) pair where the pattern matches the path, or None."""
+    matchers = compile_patterns(patterns)
+    for path in paths:
+        for regex, matched in matchers:
+            m = regex.search(path)
+            if m is not None:
+                return path, matched[int(m.lastgroup[1:])] if len(matched) > 1 else matched[0]
+    return None
 
 
 def exit_build():
@@ -4,32 +4,149 @@
 import json
 import subprocess
 import os
+import re
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
 
 
-GETH_VERSION='v1.12.0'
+OP_GETH_MODULE='github.com/ethereum-optimism/op-geth'
+OP_GETH_BRANCH='optimism'
+
+MONOREPO_DIR=os.path.realpath(os.path.join(os.path.dirname(__file__), '..', '..'))
+SKIP_DIRS={'node_modules', 'vendor', 'testdata'}
+GETH_REQUIRE_RE=re.compile(r'^\s*(?:require\s+)?github\.com/ethereum/go-ethereum\s+(v\S+)', re.MULTILINE)
+
+
+class ModuleError(Exception):
+	def __init__(self, project, cmd, output):
+		super().__init__(f'{" ".join(cmd)} failed in {project}')
+		self.project = project
+		self.output = output
 
 
 def main():
-	for project in ('.', 'indexer'):
-		print(f'Updating {project}...')
-		update_mod(project)
+	projects = find_geth_modules(MONOREPO_DIR)
+	print(f'Updating {len(projects)} modules: {", ".join(projects)}')
+	if not projects:
+		return
+
+	# Resolve the op-geth branch once. This warms the module cache shared by all the
+	# tidy runs, and pins every module to the same op-geth commit.
+	start = time.monotonic()
+	version = resolve_op_geth()
+	print(f'Resolved {OP_GETH_MODULE}@{OP_GETH_BRANCH} to {version} in {time.monotonic() - start:.1f}s')
+
+	runner = Runner()
+	timings = {}
+	with ThreadPoolExecutor(max_workers=len(projects)) as pool:
+		futures = {
+			pool.submit(update_mod, runner, project, geth_version, version): project
+			for project, geth_version in projects.items()
+		}
+		done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+		for fut in done:
+			err = fut.exception()
+			if err is None:
+				timings[futures[fut]] = fut.result()
+				continue
+			# Fail fast: stop the other modules and show what went wrong.
+			runner.cancel()
+			for other in pending:
+				other.cancel()
+			if not isinstance(err, ModuleError):
+				raise err
+			print(f'Updating {err.project} failed:', file=sys.stderr)
+			print(err.output, file=sys.stderr)
+			sys.exit(1)
+
+	for project, elapsed in sorted(timings.items(), key=lambda t: -t[1]):
+		print(f'{elapsed:7.1f}s  {project}')
+
+
+def find_geth_modules(root):
+	"""
+	Returns the dirs, relative to root, of every go.mod that requires go-ethereum,
+	with the go-ethereum version each requires.
+	"""
+	projects = {}
+	for dirpath, dirnames, filenames in os.walk(root):
+		dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.startswith('.'))
+		if 'go.mod' not in filenames:
+			continue
+		with open(os.path.join(dirpath, 'go.mod')) as f:
+			match = GETH_REQUIRE_RE.search(f.read())
+		if match:
+			projects[os.path.relpath(dirpath, root)] = match.group(1)
+	return projects
+
+
+def resolve_op_geth():
+	out = subprocess.run([
+		'go',
+		'mod',
+		'download',
+		'-json',
+		f'{OP_GETH_MODULE}@{OP_GETH_BRANCH}'
+	], cwd=MONOREPO_DIR, check=True, capture_output=True, text=True).stdout
+	return json.loads(out)['Version']
+
+
+class Runner:
+	"""Runs commands for several modules at once, and kills them all on cancel."""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.procs = set()
+		self.cancelled = False
+
+	def run(self, project, cmd):
+		with self.lock:
+			if self.cancelled:
+				raise ModuleError(project, cmd, 'cancelled')
+			# In its own process group, so cancel also stops the git and go processes it starts.
+			proc = subprocess.Popen(cmd, cwd=os.path.join(MONOREPO_DIR, project), stdout=subprocess.PIPE,
+				stderr=subprocess.STDOUT, text=True, start_new_session=True)
+			self.procs.add(proc)
+		try:
+			output, _ = proc.communicate()
+		finally:
+			with self.lock:
+				self.procs.discard(proc)
+		if proc.returncode != 0:
+			raise ModuleError(project, cmd, output)
+
+	def cancel(self):
+		with self.lock:
+			self.cancelled = True
+			for proc in self.procs:
+				try:
+					os.killpg(proc.pid, signal.SIGKILL)
+				except ProcessLookupError:
+					pass
 
 
-def update_mod(project):
-	print('Replacing...')
-	subprocess.run([
+def update_mod(runner, project, geth_version, version):
+	start = time.monotonic()
+	print(f'Replacing in {project}...')
+	runner.run(project, [
 		'go',
 		'mod',
 		'edit',
 		'-replace',
-		f'github.com/ethereum/go-ethereum@{GETH_VERSION}=github.com/ethereum-optimism/op-geth@optimism'
-	], cwd=os.path.join(project), check=True)
-	print('Tidying...')
-	subprocess.run([
+		f'github.com/ethereum/go-ethereum@{geth_version}={OP_GETH_MODULE}@{version}'
+	])
+	print(f'Tidying {project}...')
+	runner.run(project, [
 		'go',
 		'mod',
 		'tidy'
-	], cwd=os.path.join(project), check=True)
+	])
+	elapsed = time.monotonic() - start
+	print(f'Updated {project} in {elapsed:.1f}s')
+	return elapsed
 
 
 if __name__ == '__main__':
@@ -15,7 +15,7 @@ import { LibPosition } from "src/dispute/lib/LibPosition.sol";
 
 /**
  * @title FaultDisputeGameViz
- * @dev To run this script, make sure to install the `dagviz` & `eth_abi` python packages.
+ * @dev To run this script, make sure `python3` is installed.
  */
 contract FaultDisputeGameViz is Script, FaultDisputeGame_Init {
     /// @dev The root claim of the game.
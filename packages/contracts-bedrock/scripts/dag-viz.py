@@ -1,28 +1,389 @@
+"""
+Renders the claims of a FaultDisputeGame as an SVG graph.
+
+    python3 scripts/dag-viz.py <abi-encoded ClaimData[]>
+    python3 scripts/dag-viz.py --input claims.hex --out game.svg --max-depth 16
+    python3 scripts/dag-viz.py --rpc http://localhost:8545 --game <address> --follow
+
+Claims are laid out in rows by the depth of their position, read from the gindex
+bits, and in order of arrival within a row. Claims below `--max-depth`, and the
+children of a claim beyond its first `--max-children`, are collapsed into a single
+summary node under their nearest visible ancestor. The SVG is written element by
+element, so memory stays at a few bytes per claim.
+
+With `--rpc`, the claims are read from a FaultDisputeGame contract with batched
+`claimData` calls. `--follow` then reads the game again on every new block and
+rewrites the SVG from the cached SVG of the claims that did not change. `step` and
+`resolveClaim` change whether a claim is countered without emitting an event, so
+every claim is read again until the game is resolved.
+"""
+import argparse
+import io
+import json
+import os
 import sys
-import dagviz
-import networkx as nx
-from eth_abi import decode
+import time
+import urllib.request
+from array import array
 
 # The parent of the root claim is uint32 max.
 ROOT_PARENT = 4294967295
 
-# Get the abi-encoded input
-b = sys.argv[1].removeprefix('0x')
-
-# Decode the input
-t = decode(['(uint32,bool,bytes32,uint128,uint128)[]'], bytes.fromhex(b))[0]
-
-# Create the graph
-G = nx.DiGraph()
-for c in t:
-    claim = c[2].hex()
-    key = f"Position: {bin(c[3])[2:]} | Claim: 0x{claim[:4]}..{claim[60:64]}"
-    G.add_node(key)
-    if int(c[0]) != ROOT_PARENT:
-        pclaim = t[c[0]][2].hex()
-        G.add_edge(f"Position: {bin(t[c[0]][3])[2:]} | Claim: 0x{pclaim[:4]}..{pclaim[60:64]}", key)
-r = dagviz.render_svg(G)
-
-f = open('dispute_game.svg', 'w')
-f.write(r)
-f.close()
+WORD = 32
+# Number of words of an IFaultDisputeGame.ClaimData: parentIndex, counteredBy,
+# claimant, bond, claim, position and clock.
+CLAIM_WORDS = 7
+CLAIM_SIZE = CLAIM_WORDS * WORD
+
+CLAIM_DATA_LEN_SELECTOR = '0x8980e0cc'
+CLAIM_DATA_SELECTOR = '0xc6f0308c'
+STATUS_SELECTOR = '0x200d2ed2'
+# GameStatus.IN_PROGRESS
+IN_PROGRESS = 0
+
+NODE_WIDTH = 120
+NODE_HEIGHT = 28
+COLUMN_WIDTH = 140
+ROW_HEIGHT = 72
+MARGIN = 20
+
+STYLE = (
+    'rect{fill:#f5f5f5;stroke:#555}'
+    '.countered rect{stroke:#c62828;stroke-width:2}'
+    '.summary rect{fill:#e0e0e0;stroke-dasharray:4 2}'
+    'text{font:11px monospace;text-anchor:middle;dominant-baseline:central}'
+    'line{stroke:#999}'
+)
+
+
+def iter_claims(read):
+    """
+    Yields (parent index, countered, claim, position) for each claim of an
+    abi-encoded ClaimData[], reading it through `read(n)` one claim at a time.
+    """
+    offset = int.from_bytes(read(WORD), 'big')
+    read(offset - WORD)
+    length = int.from_bytes(read(WORD), 'big')
+    for _ in range(length):
+        c = read(CLAIM_SIZE)
+        if len(c) < CLAIM_SIZE:
+            raise ValueError('Truncated ClaimData[]')
+        yield decode_claim(c)
+
+
+def decode_claim(c):
+    """Decodes an abi-encoded ClaimData, which is also what `claimData(i)` returns."""
+    return (
+        int.from_bytes(c[0:WORD], 'big'),
+        any(c[WORD:2 * WORD]),
+        c[4 * WORD:5 * WORD],
+        int.from_bytes(c[5 * WORD:6 * WORD], 'big'),
+    )
+
+
+class HexReader:
+    """Reads bytes from a text stream of hex, with or without a 0x prefix."""
+
+    def __init__(self, f):
+        self.f = f
+        prefix = f.read(2)
+        self.pending = '' if prefix.lower() == '0x' else prefix
+
+    def read(self, n):
+        text = self.pending + self.f.read(2 * n - len(self.pending))
+        self.pending = ''
+        return bytes.fromhex(text.strip())
+
+
+class GameGraph:
+    """
+    Layout of a claim graph, keyed by claim index. Claims must be added in index
+    order, which is the order of the game's claimData array, so a parent is always
+    known before its children and the layout of earlier claims never changes.
+    """
+
+    def __init__(self, max_depth=None, max_children=None):
+        self.max_depth = max_depth
+        self.max_children = max_children
+        self.parents = array('I')
+        self.countered = bytearray()
+        # First and last two bytes of each claim, enough for its label.
+        self.labels = bytearray()
+        self.positions = []
+        # The claim itself if visible, otherwise its nearest visible ancestor.
+        self.owners = array('I')
+        self.children = array('I')
+        # Row and column of each visible claim, -1 for collapsed ones.
+        self.rows = array('b')
+        self.columns = array('i')
+        self.row_sizes = []
+        # Owner claim index -> [row, column, number of collapsed claims].
+        self.summaries = {}
+
+    def __len__(self):
+        return len(self.parents)
+
+    def add(self, parent, countered, claim, position):
+        i = len(self.parents)
+        root = parent == ROOT_PARENT
+        depth = position.bit_length() - 1
+        self.parents.append(parent)
+        self.countered.append(countered)
+        self.labels += claim[:2] + claim[-2:]
+        self.positions.append(position)
+        self.children.append(0)
+
+        if root:
+            visible = True
+        else:
+            self.children[parent] += 1
+            visible = self.rows[parent] >= 0
+            if self.max_depth is not None and depth > self.max_depth:
+                visible = False
+            if self.max_children is not None and self.children[parent] > self.max_children:
+                visible = False
+
+        if visible:
+            self.owners.append(i)
+            self.rows.append(depth)
+            self.columns.append(self._place(depth))
+            return
+        owner = self.owners[parent]
+        self.owners.append(owner)
+        self.rows.append(-1)
+        self.columns.append(-1)
+        summary = self.summaries.get(owner)
+        if summary is None:
+            row = self.rows[owner] + 1
+            summary = self.summaries[owner] = [row, self._place(row), 0]
+        summary[2] += 1
+
+    def counter(self, i, countered=True):
+        self.countered[i] = countered
+
+    def _place(self, row):
+        while len(self.row_sizes) <= row:
+            self.row_sizes.append(0)
+        self.row_sizes[row] += 1
+        return self.row_sizes[row] - 1
+
+    def center(self, row, column):
+        return MARGIN + column * COLUMN_WIDTH + NODE_WIDTH // 2, MARGIN + row * ROW_HEIGHT + NODE_HEIGHT // 2
+
+    def label(self, i):
+        b = self.labels[4 * i:4 * i + 4]
+        return f'0x{b[:2].hex()}..{b[2:].hex()}'
+
+    def title(self, i):
+        return f'Claim {i} | Position: {bin(self.positions[i])[2:]} | Claim: {self.label(i)}'
+
+    def edge(self, i):
+        """Returns the SVG of the edge from the parent of visible claim `i`, if any."""
+        parent = self.parents[i]
+        if parent == ROOT_PARENT:
+            return ''
+        x1, y1 = self.center(self.rows[parent], self.columns[parent])
+        x2, y2 = self.center(self.rows[i], self.columns[i])
+        return f'<line x1="{x1}" y1="{y1 + NODE_HEIGHT // 2}" x2="{x2}" y2="{y2 - NODE_HEIGHT // 2}"/>\n'
+
+    def node(self, i):
+        """Returns the SVG of visible claim `i`."""
+        x, y = self.center(self.rows[i], self.columns[i])
+        cls = ' class="countered"' if self.countered[i] else ''
+        return (
+            f'<g{cls}><title>{self.title(i)}</title>'
+            f'<rect x="{x - NODE_WIDTH // 2}" y="{y - NODE_HEIGHT // 2}" width="{NODE_WIDTH}" height="{NODE_HEIGHT}"/>'
+            f'<text x="{x}" y="{y}">{self.label(i)}</text></g>\n'
+        )
+
+    def summary(self, owner):
+        """Returns the SVG of the claims collapsed under visible claim `owner`."""
+        row, column, count = self.summaries[owner]
+        x1, y1 = self.center(self.rows[owner], self.columns[owner])
+        x, y = self.center(row, column)
+        return (
+            f'<line x1="{x1}" y1="{y1 + NODE_HEIGHT // 2}" x2="{x}" y2="{y - NODE_HEIGHT // 2}"/>'
+            f'<g class="summary"><title>{count} claims collapsed under claim {owner}</title>'
+            f'<rect x="{x - NODE_WIDTH // 2}" y="{y - NODE_HEIGHT // 2}" width="{NODE_WIDTH}" height="{NODE_HEIGHT}"/>'
+            f'<text x="{x}" y="{y}">+{count} claims</text></g>\n'
+        )
+
+    def header(self):
+        width = 2 * MARGIN + max(self.row_sizes, default=0) * COLUMN_WIDTH
+        height = 2 * MARGIN + len(self.row_sizes) * ROW_HEIGHT
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}">\n<style>{STYLE}</style>\n'
+        )
+
+    def render(self, f):
+        """Writes the graph as SVG to `f`: edges first, so nodes are drawn over them."""
+        f.write(self.header())
+        visible = [i for i in range(len(self)) if self.rows[i] >= 0]
+        for i in visible:
+            f.write(self.edge(i))
+        for i in visible:
+            f.write(self.node(i))
+        for owner in self.summaries:
+            f.write(self.summary(owner))
+        f.write('</svg>\n')
+
+
+class IncrementalRender:
+    """
+    Keeps the SVG of every claim drawn so far. Since the layout of a claim never
+    changes once added, an update only formats the new claims, the claims countered
+    since and the summaries, and writes the rest from the cache.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.edges = []
+        self.nodes = {}
+        self.rendered = 0
+
+    def counter(self, i, countered=True):
+        self.graph.counter(i, countered)
+        if i in self.nodes:
+            self.nodes[i] = self.graph.node(i)
+
+    def write(self, path):
+        g = self.graph
+        for i in range(self.rendered, len(g)):
+            if g.rows[i] >= 0:
+                self.edges.append(g.edge(i))
+                self.nodes[i] = g.node(i)
+        self.rendered = len(g)
+        # Replaced atomically, so a viewer reloading the file never sees half of it.
+        with open(f'{path}.tmp', 'w', buffering=1 << 20) as f:
+            f.write(g.header())
+            f.writelines(self.edges)
+            f.writelines(self.nodes.values())
+            for owner in g.summaries:
+                f.write(g.summary(owner))
+            f.write('</svg>\n')
+        os.replace(f'{path}.tmp', path)
+
+
+class RPC:
+    """Minimal JSON-RPC client that sends calls in batches."""
+
+    def __init__(self, url):
+        self.url = url
+
+    def batch(self, calls):
+        """Sends [(method, params)] in one request and returns the results in order."""
+        body = json.dumps([
+            {'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params}
+            for i, (method, params) in enumerate(calls)
+        ]).encode()
+        req = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=30) as res:
+            responses = json.load(res)
+        if isinstance(responses, dict):
+            raise RuntimeError(f'RPC batch failed: {responses.get("error")}')
+        results = [None] * len(calls)
+        for r in responses:
+            if 'error' in r:
+                raise RuntimeError(f'{calls[r["id"]][0]} failed: {r["error"]}')
+            results[r['id']] = r['result']
+        return results
+
+    def call(self, method, *params):
+        return self.batch([(method, list(params))])[0]
+
+
+def fetch_claims(rpc, game, indices, block, batch_size):
+    """Yields the decoded claims of `game` at `block` with the given indices, in order."""
+    for lo in range(0, len(indices), batch_size):
+        calls = [
+            ('eth_call', [{'to': game, 'data': CLAIM_DATA_SELECTOR + i.to_bytes(WORD, 'big').hex()}, block])
+            for i in indices[lo:lo + batch_size]
+        ]
+        for result in rpc.batch(calls):
+            yield decode_claim(bytes.fromhex(result[2:]))
+
+
+def follow_game(rpc, game, graph, out, poll_interval, batch_size, follow):
+    """
+    Renders the claims of `game` to `out`. With `follow`, keeps reading the game on
+    every new block, adding new claims and updating countered ones, until interrupted.
+    """
+    render = IncrementalRender(graph)
+    last = None
+    resolved = False
+    while True:
+        head = int(rpc.call('eth_blockNumber'), 16)
+        if last is None or head > last:
+            # Read at a fixed block, so all the claims agree.
+            block = hex(head)
+            length, status = (int(r, 16) for r in rpc.batch([
+                ('eth_call', [{'to': game, 'data': CLAIM_DATA_LEN_SELECTOR}, block]),
+                ('eth_call', [{'to': game, 'data': STATUS_SELECTOR}, block]),
+            ]))
+            changed = last is None or length > len(graph)
+            # step and resolveClaim set counteredBy without an event, resolveClaim even
+            # back to zero on claims with children, so the known claims are read again.
+            known = len(graph)
+            if last is not None:
+                for i, (_, countered, _, _) in enumerate(fetch_claims(rpc, game, range(known), block, batch_size)):
+                    if countered != bool(graph.countered[i]):
+                        render.counter(i, countered)
+                        changed = True
+            for claim in fetch_claims(rpc, game, range(known, length), block, batch_size):
+                graph.add(*claim)
+            resolved = status != IN_PROGRESS
+            if changed:
+                render.write(out)
+                print(f'Rendered {len(graph)} claims at block {head} to {out}', flush=True)
+            last = head
+        if not follow:
+            return
+        if resolved:
+            print(f'Game resolved at block {last}', flush=True)
+            return
+        time.sleep(poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Renders the claims of a FaultDisputeGame as an SVG graph')
+    parser.add_argument('claims', nargs='?', help='abi-encoded ClaimData[], as hex')
+    parser.add_argument('--input', help='File with the abi-encoded ClaimData[] as hex, - for stdin')
+    parser.add_argument('--out', default='dispute_game.svg', help='SVG file to write')
+    parser.add_argument('--max-depth', type=int, help='Collapse claims deeper than this position depth')
+    parser.add_argument('--max-children', type=int, help='Collapse the children of a claim beyond this many')
+    parser.add_argument('--rpc', help='JSON-RPC URL to read the claims of --game from')
+    parser.add_argument('--game', help='Address of the FaultDisputeGame to read with --rpc')
+    parser.add_argument('--follow', action='store_true', help='Keep updating the graph on new blocks until the game is resolved')
+    parser.add_argument('--poll-interval', type=float, default=2, help='Seconds between polls for new blocks')
+    parser.add_argument('--batch-size', type=int, default=500, help='Number of claimData calls per RPC batch')
+    args = parser.parse_args()
+
+    graph = GameGraph(args.max_depth, args.max_children)
+    if args.rpc:
+        if not args.game:
+            parser.error('--rpc needs --game')
+        try:
+            follow_game(RPC(args.rpc), args.game, graph, args.out, args.poll_interval, args.batch_size, args.follow)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if args.input == '-':
+        source = sys.stdin
+    elif args.input:
+        source = open(args.input)
+    elif args.claims:
+        source = io.StringIO(args.claims)
+    else:
+        parser.error('Pass the claims as an argument or with --input')
+
+    with source:
+        for claim in iter_claims(HexReader(source).read):
+            graph.add(*claim)
+    with open(args.out, 'w', buffering=1 << 20) as f:
+        graph.render(f)
+
+
+if __name__ == '__main__':
+    main()
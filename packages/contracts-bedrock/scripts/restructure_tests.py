@@ -1,57 +1,169 @@
+import argparse
+import json
 import os
-import shutil
+import sys
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
 
+# Test dirs whose layout does not mirror the src folder. Their tests are named after
+# the contract they cover, but live apart from its unit tests.
+EXCLUDED_DIRS = ("invariants", "kontrol", "mocks", "setup", "actors", "safe-tools")
 
-def mimic_directory_structure(src_folder: str, test_folder: str) -> None:
+# Where incremental runs keep the mtimes of the source dirs and the tests in place.
+STATE_FILE = os.path.join("cache", "restructure-tests.json")
+
+
+class Move(NamedTuple):
+    source: str
+    dest: str
+
+
+class Plan(NamedTuple):
+    moves: List[Move]
+    conflicts: List[Tuple[str, str]]
+    unmatched: List[str]
+    in_place: List[str]
+
+
+def index_sources(src_folder: str) -> Tuple[Dict[str, List[str]], Dict[str, int]]:
+    """
+    Walks the src folder once and returns the paths of its .sol files, relative to
+    the folder and keyed by basename, along with the mtime of every directory walked.
+    """
+    index: Dict[str, List[str]] = {}
+    dirs: Dict[str, int] = {}
+    for root, _, files in os.walk(src_folder):
+        dirs[root] = os.stat(root).st_mtime_ns
+        for file in files:
+            if file.endswith(".sol"):
+                index.setdefault(file, []).append(
+                    os.path.relpath(os.path.join(root, file), src_folder))
+    return index, dirs
+
+
+def find_tests(test_folder: str, excluded: Tuple[str, ...]) -> List[str]:
+    """Returns the paths of the .t.sol files under the test folder, relative to it."""
+    tests = []
+    for root, dirnames, files in os.walk(test_folder):
+        if root == test_folder:
+            dirnames[:] = [d for d in dirnames if d not in excluded]
+        for file in files:
+            if file.endswith(".t.sol"):
+                tests.append(os.path.relpath(os.path.join(root, file), test_folder))
+    return sorted(tests)
+
+
+def plan_moves(index: Dict[str, List[str]], tests: List[str], test_folder: str) -> Plan:
+    """
+    Returns the moves that put each test at the path of its source file, relative to
+    the test folder. A move conflicts if the test matches several source files, or if
+    its destination exists or is the destination of another test.
+    """
+    moves = []
+    conflicts = []
+    unmatched = []
+    in_place = []
+    claimed: Dict[str, str] = {}
+    for test in tests:
+        sol_file = os.path.basename(test).replace(".t.sol", ".sol")
+        candidates = [p.replace(".sol", ".t.sol") for p in index.get(sol_file, [])]
+        if not candidates:
+            unmatched.append(test)
+        elif test in candidates:
+            in_place.append(test)
+        elif len(candidates) > 1:
+            conflicts.append((test, f"matches several source files: {', '.join(sorted(candidates))}"))
+        elif candidates[0] in claimed:
+            conflicts.append((test, f"{candidates[0]} is also the destination of {claimed[candidates[0]]}"))
+        elif os.path.exists(os.path.join(test_folder, candidates[0])):
+            conflicts.append((test, f"{candidates[0]} already exists"))
+        else:
+            claimed[candidates[0]] = test
+            moves.append(Move(test, candidates[0]))
+    return Plan(moves, conflicts, unmatched, in_place)
+
+
+def apply_moves(moves: List[Move], test_folder: str) -> None:
+    """Creates every destination directory, then moves the tests."""
+    for dest_dir in sorted({os.path.dirname(m.dest) for m in moves}):
+        os.makedirs(os.path.join(test_folder, dest_dir), exist_ok=True)
+    for move in moves:
+        os.rename(os.path.join(test_folder, move.source), os.path.join(test_folder, move.dest))
+        print(f"Moved {move.source} to {move.dest}")
+
+
+def load_state(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_state(path: str, dirs: Dict[str, int], checked: Set[str]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"dirs": dirs, "checked": sorted(checked)}, f)
+
+
+def mimic_directory_structure(src_folder: str, test_folder: str, excluded: Tuple[str, ...] = EXCLUDED_DIRS,
+                              dry_run: bool = False, state_path: Optional[str] = None) -> Plan:
     """
     This function takes a source folder and a test folder as input, and restructures
     the test folder to match the directory structure of the source folder.
 
-    Only moves test files ("<name>.t.sol") at the root level of the `test` folder.
+    Moves test files ("<name>.t.sol") anywhere in the `test` folder, except under the
+    excluded dirs. With `state_path`, only tests that were not in place on the last
+    run are checked, unless a directory of the source folder changed since.
     """
+    state = load_state(state_path) if state_path else None
+    index, dirs = index_sources(src_folder)
+    checked: Set[str] = set()
+    if state is not None and state["dirs"] == dirs:
+        checked = set(state["checked"])
 
-    # Walk through the src folder and collect a list of all .sol files
-    sol_files = []
-    for root, _, files in os.walk(src_folder):
-        for file in files:
-            if file.endswith(".sol"):
-                sol_files.append(os.path.join(root, file))
-
-    # Iterate through each .t.sol file in the test folder
-    for test_file in os.listdir(test_folder):
-        if test_file.endswith(".t.sol"):
-            # Construct the corresponding .sol file name
-            sol_file = test_file.replace(".t.sol", ".sol")
-
-            # Find the full path of the corresponding .sol file in the src folder
-            src_path = None
-            for sol_path in sol_files:
-                if sol_path.endswith(os.path.sep + sol_file):
-                    src_path = sol_path
-                    break
-
-            if src_path:
-                # Calculate the relative path from the src folder to the .sol file
-                rel_path = os.path.relpath(src_path, src_folder)
-
-                # Construct the destination path within the test folder
-                dest_path = os.path.join(
-                    test_folder, rel_path).replace(".sol", ".t.sol")
-
-                # Create the directory structure if it doesn't exist
-                dest_dir = os.path.dirname(dest_path)
-                os.makedirs(dest_dir, exist_ok=True)
-
-                # Copy the .t.sol file to the destination folder
-                shutil.move(os.path.join(test_folder, test_file), dest_path)
-                print(f"Moved {test_file} to {dest_path}")
-            else:
-                print(f"No corresponding .sol file found for {test_file}")
-
-
-# Specify the source and test folder paths
-src_folder = "src"
-test_folder = "test"
-
-# Call the mimic_directory_structure function
-mimic_directory_structure(src_folder, test_folder)
+    tests = find_tests(test_folder, excluded)
+    plan = plan_moves(index, [t for t in tests if t not in checked], test_folder)
+
+    for test, reason in plan.conflicts:
+        print(f"Cannot move {test}: {reason}")
+    for test in plan.unmatched:
+        print(f"No corresponding .sol file found for {test}")
+    if dry_run:
+        for move in plan.moves:
+            print(f"Would move {move.source} to {move.dest}")
+    else:
+        apply_moves(plan.moves, test_folder)
+
+    if state_path:
+        in_place = set(plan.in_place) | set(plan.unmatched)
+        if not dry_run:
+            in_place |= {m.dest for m in plan.moves}
+        save_state(state_path, dirs, (checked & set(tests)) | in_place)
+    return plan
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Moves tests to mirror the layout of the source folder")
+    parser.add_argument("--src", default="src", help="Source folder")
+    parser.add_argument("--test", default="test", help="Test folder")
+    parser.add_argument("--exclude", action="append", help="Test dir to leave alone, may be repeated")
+    parser.add_argument("--dry-run", action="store_true", help="Print the moves without making them")
+    parser.add_argument("--check", action="store_true",
+                        help="Fail if any test is out of place, without moving it")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"Only check tests that changed since the last run, tracked in {STATE_FILE}")
+    args = parser.parse_args()
+
+    plan = mimic_directory_structure(
+        args.src,
+        args.test,
+        excluded=tuple(args.exclude) if args.exclude else EXCLUDED_DIRS,
+        dry_run=args.dry_run or args.check,
+        state_path=STATE_FILE if args.incremental else None,
+    )
+    if plan.conflicts or (args.check and plan.moves):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
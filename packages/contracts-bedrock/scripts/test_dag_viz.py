@@ -0,0 +1,124 @@
+"""
+Tests of dag-viz.py follow mode against an in-memory game. Run from this directory:
+
+    python3 -m unittest test_dag_viz
+"""
+import importlib.util
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+spec = importlib.util.spec_from_file_location('dag_viz', os.path.join(os.path.dirname(__file__), 'dag-viz.py'))
+dag_viz = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(dag_viz)
+
+WORD = dag_viz.WORD
+COUNTERED_BY = b'\x11' * 20
+
+
+def encode_claim(parent, countered_by, claim, position):
+    return (
+        parent.to_bytes(WORD, 'big')
+        + countered_by.rjust(WORD, b'\0')
+        + bytes(2 * WORD)
+        + claim
+        + position.to_bytes(WORD, 'big')
+        + bytes(WORD)
+    )
+
+
+class FakeGame:
+    """Answers the calls follow_game makes, from claims that tests change between blocks."""
+
+    def __init__(self):
+        self.block = 1
+        self.status = dag_viz.IN_PROGRESS
+        # [parent, countered by, claim, position]
+        self.claims = [[dag_viz.ROOT_PARENT, b'', b'\xaa' * WORD, 1]]
+
+    def move(self, parent, position):
+        self.claims.append([parent, b'', bytes([len(self.claims)]) * WORD, position])
+        self.claims[parent][1] = COUNTERED_BY
+
+    def batch(self, calls):
+        return [self.call(method, *params) for method, params in calls]
+
+    def call(self, method, *params):
+        if method == 'eth_blockNumber':
+            return hex(self.block)
+        data = params[0]['data']
+        if data == dag_viz.CLAIM_DATA_LEN_SELECTOR:
+            return hex(len(self.claims))
+        if data == dag_viz.STATUS_SELECTOR:
+            return hex(self.status)
+        return '0x' + encode_claim(*self.claims[int(data[10:], 16)]).hex()
+
+
+class FollowGameTest(unittest.TestCase):
+    def follow(self, game, steps):
+        """Runs follow_game, applying each step and mining a block between polls. Returns the countered flags after each poll."""
+        graph = dag_viz.GameGraph()
+        seen = []
+        steps = iter(steps)
+
+        def sleep(_):
+            seen.append(list(graph.countered))
+            step = next(steps, None)
+            if step is None:
+                raise StopIteration
+            step()
+            game.block += 1
+
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(dag_viz.time, 'sleep', sleep):
+            out = os.path.join(tmp, 'game.svg')
+            try:
+                dag_viz.follow_game(game, '0x00', graph, out, 0, 2, follow=True)
+            except StopIteration:
+                pass
+            seen.append(list(graph.countered))
+            with open(out) as f:
+                svg = f.read()
+        return seen, svg
+
+    def test_step_counters_leaf(self):
+        game = FakeGame()
+        game.move(0, 2)
+
+        def step():
+            game.claims[1][1] = COUNTERED_BY
+
+        seen, svg = self.follow(game, [step])
+        self.assertEqual(seen[0], [1, 0])
+        self.assertEqual(seen[1], [1, 1])
+        self.assertEqual(svg.count('class="countered"'), 2)
+
+    def test_resolved_after_children(self):
+        game = FakeGame()
+        game.move(0, 2)
+        game.move(1, 4)
+
+        def resolve_claim_1():
+            # Claim 2 is uncontested, so resolveClaim(1) sets claim 1's counteredBy,
+            # which its child had set, to the resolver.
+            game.claims[1][1] = b'\x22' * 20
+
+        def resolve_root():
+            # Claim 1 was countered, so the root stands: resolveClaim(0) clears it.
+            game.claims[0][1] = b''
+            game.status = 2
+
+        seen, svg = self.follow(game, [resolve_claim_1, resolve_root])
+        self.assertEqual(seen[0], [1, 1, 0])
+        self.assertEqual(seen[-1], [0, 1, 0])
+        self.assertEqual(svg.count('class="countered"'), 1)
+
+    def test_stops_once_resolved(self):
+        game = FakeGame()
+        game.status = 1
+        seen, _ = self.follow(game, [])
+        self.assertEqual(len(seen), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()